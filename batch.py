@@ -0,0 +1,190 @@
+# Plays many draughts games at once with NumPy
+# Every board is held as bitboards in one array so each step works on the whole batch without a loop per board
+import numpy as np
+from draughts import Draughts, PLAYER1, PLAYER2, SQUARES, FULL, DIRECTION_SHIFTS, MAN_DIRECTIONS, PROMOTION_ROW, \
+    PIECE_VALUE, OPPOSITE, SQUARE_XY
+
+DIRECTIONS = ["LU", "LD", "RU", "RD"]
+# Actions are numbered direction * 32 + square, the same order as Draughts.valid_moves
+ACTIONS = len(DIRECTIONS) * SQUARES
+ONE = np.uint64(1)
+FULL64 = np.uint64(FULL)
+# Value of every square for PLAYER1 in sevenths indexed by [player, kind, square]
+SQUARE_VALUES = np.array([[PIECE_VALUE[PLAYER1], PIECE_VALUE[2 * PLAYER1]],
+                          [PIECE_VALUE[PLAYER2], PIECE_VALUE[2 * PLAYER2]]], dtype=np.int64)
+# Whether regular pieces can move in each direction indexed by [player, direction]
+MAN_CAN_MOVE = np.array([[d in MAN_DIRECTIONS[p] for d in DIRECTIONS] for p in (PLAYER1, PLAYER2)])
+PROMOTION = np.array([PROMOTION_ROW[PLAYER1], PROMOTION_ROW[PLAYER2]], dtype=np.uint64)
+
+
+def shiftMasks(masks: np.ndarray, direction: str) -> np.ndarray:
+    es, em, os, om = DIRECTION_SHIFTS[direction]
+    e = masks & np.uint64(em)
+    o = masks & np.uint64(om)
+    e = e << np.uint64(es) if es > 0 else e >> np.uint64(-es)
+    o = o << np.uint64(os) if os > 0 else o >> np.uint64(-os)
+    return e | o
+
+
+# Turns (n,) masks into (n, 32) booleans
+def unpackMasks(masks: np.ndarray) -> np.ndarray:
+    bits = np.unpackbits(masks.astype("<u8").view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    return bits[:, :SQUARES].astype(bool)
+
+
+class DraughtsBatch:
+    def __init__(self, n: int, game: Draughts = None):
+        if game is None:
+            game = Draughts()
+        self.n = n
+        # bits[board, player, kind], player 0 is PLAYER1 and kind 0 is regular pieces, 1 kings
+        self.bits = np.zeros((n, 2, 2), dtype=np.uint64)
+        for i, p in enumerate((PLAYER1, PLAYER2)):
+            self.bits[:, i, 0] = game.men[p]
+            self.bits[:, i, 1] = game.kings[p]
+        self.turn = np.full(n, game.turn, dtype=np.int8)
+        # The piece which has to carry on taking, 0 when a new turn starts
+        self.chain = np.zeros(n, dtype=np.uint64)
+        # Number of forfeited turns in a row, two means neither player can move
+        self.passes = np.zeros(n, dtype=np.int8)
+        self.plies = np.zeros(n, dtype=np.int32)
+        self.done = np.zeros(n, dtype=bool)
+        # Winning player, 0 for a draw or an unfinished game
+        self.winner = np.zeros(n, dtype=np.int8)
+        self.rows = np.arange(n)
+
+    def playerIndex(self) -> np.ndarray:
+        return (self.turn == PLAYER2).astype(np.intp)
+
+    def getGame(self, i: int) -> Draughts:
+        game = Draughts()
+        game.turn = int(self.turn[i])
+        game.setBits({p: int(self.bits[i, j, 0]) for j, p in enumerate((PLAYER1, PLAYER2))},
+                     {p: int(self.bits[i, j, 1]) for j, p in enumerate((PLAYER1, PLAYER2))})
+        return game
+
+    # Every board in the packed (n, 3) format from draughts.packPositions
+    def packPositions(self) -> np.ndarray:
+        p1 = self.bits[:, 0, 0] | self.bits[:, 0, 1]
+        p2 = self.bits[:, 1, 0] | self.bits[:, 1, 1]
+        kings = self.bits[:, 0, 1] | self.bits[:, 1, 1]
+        return np.stack([p1, p2, kings], axis=1).astype(np.uint32)
+
+    def rawScores(self) -> np.ndarray:
+        squares = np.unpackbits(self.bits.astype("<u8").view(np.uint8).reshape(self.n, 2, 2, 8), axis=3,
+                                bitorder="little")[..., :SQUARES]
+        return np.einsum("ipks,pks->i", squares.astype(np.int64), SQUARE_VALUES)
+
+    # Same as Draughts.evalBoard for every board, player defaults to the player to move
+    def evalBoard(self, player=None) -> np.ndarray:
+        if player is None:
+            player = self.turn
+        return np.round(np.tanh(self.rawScores() * player / 28), 2)
+
+    # Returns which boards have a take and the squares that can move in each direction with shape (n, 4)
+    def legalMoves(self) -> tuple:
+        own = self.playerIndex()
+        rows = self.rows
+        men = self.bits[rows, own, 0]
+        kings = self.bits[rows, own, 1]
+        opp = self.bits[rows, 1 - own, 0] | self.bits[rows, 1 - own, 1]
+        empty = FULL64 & ~(men | kings | opp)
+        chained = self.chain != 0
+        men = np.where(chained, men & self.chain, men)
+        kings = np.where(chained, kings & self.chain, kings)
+        takes = np.zeros((self.n, len(DIRECTIONS)), dtype=np.uint64)
+        quiet = np.zeros((self.n, len(DIRECTIONS)), dtype=np.uint64)
+        for j, d in enumerate(DIRECTIONS):
+            src = np.where(MAN_CAN_MOVE[own, j], men | kings, kings)
+            back = OPPOSITE[d]
+            takes[:, j] = src & shiftMasks(opp & shiftMasks(empty, back), back)
+            quiet[:, j] = src & shiftMasks(empty, back)
+        take = np.bitwise_or.reduce(takes, axis=1) != 0
+        # If you can take you must, in the middle of a take only the same piece can carry on taking
+        masks = np.where((take | chained)[:, None], takes, quiet)
+        masks[self.done] = 0
+        return take, masks
+
+    # Boolean array (n, 128) of the legal actions for every board
+    def legalActions(self) -> np.ndarray:
+        _, masks = self.legalMoves()
+        return unpackMasks(masks.reshape(-1)).reshape(self.n, ACTIONS)
+
+    def randomActions(self, rng: np.random.Generator = None) -> np.ndarray:
+        if rng is None:
+            rng = np.random.default_rng()
+        legal = self.legalActions()
+        r = np.where(legal, rng.random(legal.shape), -1)
+        return np.where(legal.any(axis=1), r.argmax(axis=1), -1)
+
+    # Plays one step for every board, action -1 means the board has no legal moves
+    def step(self, actions: np.ndarray) -> None:
+        actions = np.asarray(actions)
+        rows = self.rows
+        own = self.playerIndex()
+        live = ~self.done
+        act = live & (actions >= 0)
+        stuck = live & (actions < 0)
+        a = np.where(act, actions, 0)
+        d = a // SQUARES
+        b = np.where(act, ONE << (a % SQUARES).astype(np.uint64), np.uint64(0))
+        opp = self.bits[rows, 1 - own, 0] | self.bits[rows, 1 - own, 1]
+        target = np.zeros(self.n, dtype=np.uint64)
+        beyond = np.zeros(self.n, dtype=np.uint64)
+        for j, direction in enumerate(DIRECTIONS):
+            sel = d == j
+            t = shiftMasks(b, direction)
+            target = np.where(sel, t, target)
+            beyond = np.where(sel, shiftMasks(t, direction), beyond)
+        take = act & (opp & target != 0)
+        landing = np.where(take, beyond, target)
+        king = self.bits[rows, own, 1] & b != 0
+        self.bits[rows, own, king.astype(np.intp)] ^= b
+        self.bits[rows, 1 - own, 0] &= ~np.where(take, target, np.uint64(0))
+        self.bits[rows, 1 - own, 1] &= ~np.where(take, target, np.uint64(0))
+        promoted = act & ~king & (landing & PROMOTION[own] != 0)
+        self.bits[rows, own, (king | promoted).astype(np.intp)] |= np.where(act, landing, np.uint64(0))
+        # A piece that has just taken carries on if it can take again
+        self.chain = np.where(take, landing, np.uint64(0))
+        cantake, masks = self.legalMoves()
+        carry = take & (np.bitwise_or.reduce(masks, axis=1) != 0)
+        self.chain = np.where(carry, self.chain, np.uint64(0))
+        turnover = live & ~carry
+        self.plies += turnover
+        self.passes = np.where(act, 0, self.passes + stuck)
+        self.turn = np.where(turnover, -self.turn, self.turn).astype(np.int8)
+        # A player with no pieces has lost, if neither player can move it is a draw
+        own = self.playerIndex()
+        nopieces = live & (self.bits[rows, own, 0] | self.bits[rows, own, 1] == 0)
+        self.winner = np.where(nopieces, -self.turn, self.winner).astype(np.int8)
+        self.done |= nopieces | (self.passes >= 2)
+
+    # policy takes the batch and the legal actions and returns an action for each board
+    def playGames(self, maxplies: int = 200, policy=None, rng: np.random.Generator = None) -> np.ndarray:
+        if rng is None:
+            rng = np.random.default_rng()
+        while not self.done.all():
+            if policy is None:
+                actions = self.randomActions(rng)
+            else:
+                legal = self.legalActions()
+                actions = np.where(legal.any(axis=1), policy(self, legal), -1)
+            self.step(actions)
+            self.done |= self.plies >= maxplies
+        return self.winner
+
+
+def actionToMove(action: int) -> tuple:
+    x, y = SQUARE_XY[action % SQUARES]
+    return [x, y], DIRECTIONS[action // SQUARES]
+
+
+if __name__ == "__main__":
+    import time
+    t0 = time.time()
+    batch = DraughtsBatch(10000)
+    winners = batch.playGames()
+    dt = time.time() - t0
+    print(f"Played {batch.n} games in {round(dt, 2)} seconds, {int(batch.plies.sum())} turns")
+    print(f"Player 1 wins: {(winners == PLAYER1).sum()} Player 2 wins: {(winners == PLAYER2).sum()} "
+          f"Draws/unfinished: {(winners == 0).sum()}")
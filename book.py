@@ -0,0 +1,124 @@
+# Opening book for draughts
+# Win/draw/loss counts for the player to move are collected for every position in the opening of recorded or
+# self-played games, then saved as a table sorted by position key (Draughts.hashKey)
+# The table is memory mapped and looked up with a binary search
+import sys
+import numpy as np
+from draughts import Draughts, PLAYER1, PLAYER2
+
+BOOK_DTYPE = np.dtype([("key", "<u8"), ("wins", "<u4"), ("draws", "<u4"), ("losses", "<u4")])
+
+
+class BookBuilder:
+    def __init__(self, maxply: int = 20):
+        # Only the first maxply turns of each game go in the book
+        self.maxply = maxply
+        self.stats = {}
+
+    # winner is PLAYER1, PLAYER2 or 0 for a draw, unfinished games (None) are skipped
+    def addGame(self, moves: list, winner, start: Draughts = None) -> None:
+        if winner is None:
+            return
+        # Copied so the game record doesn't move the pieces of start
+        game = Draughts()
+        if start is not None:
+            game = Draughts(start.geometry.size)
+            game.setState(start.getState())
+        for ply in range(min(self.maxply, len(moves)) + 1):
+            counts = self.stats.setdefault(game.hashKey(), [0, 0, 0])
+            if winner == 0:
+                counts[1] += 1
+            elif winner == game.turn:
+                counts[0] += 1
+            else:
+                counts[2] += 1
+            if ply == len(moves) or ply == self.maxply:
+                break
+            if moves[ply] == "":
+                game.turn = PLAYER1 + PLAYER2 - game.turn
+            else:
+                game.makeMove(moves[ply])
+
+    # Game records from pdn.readGames
+    def addRecords(self, records) -> None:
+        for record in records:
+            self.addGame(record["moves"], record["winner"], record.get("start"))
+
+    # Results from selfplay.playGames
+    def addResults(self, results: list) -> None:
+        for result in results:
+            winner = None if result["reason"] == "turn limit" else result["winner"]
+            self.addGame(result["moves"], winner)
+
+    # Positions seen fewer than mingames times are left out
+    def save(self, path: str = "book.npy", mingames: int = 1) -> int:
+        keys = sorted(k for k, c in self.stats.items() if sum(c) >= mingames)
+        table = np.zeros(len(keys), dtype=BOOK_DTYPE)
+        table["key"] = keys
+        table["wins"], table["draws"], table["losses"] = np.array([self.stats[k] for k in keys],
+                                                                  dtype=np.uint32).reshape(-1, 3).T
+        np.save(path, table)
+        return len(keys)
+
+
+class OpeningBook:
+    def __init__(self, path: str = "book.npy", mingames: int = 5):
+        self.path = path
+        # A move is only played from the book if the position after it has been seen this many times
+        self.mingames = mingames
+        self.table = None
+        self.keys = None
+        self.hits = 0
+        self.probes = 0
+
+    # The memory map is opened again in each process the book is sent to
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        state["table"] = None
+        state["keys"] = None
+        return state
+
+    def load(self) -> None:
+        self.table = np.load(self.path, mmap_mode="r")
+        self.keys = self.table["key"]
+
+    # (wins, draws, losses) for the player to move or None if the position isn't in the book
+    def lookup(self, key: int):
+        if self.table is None:
+            self.load()
+        i = np.searchsorted(self.keys, np.uint64(key))
+        if i < len(self.keys) and self.keys[i] == key:
+            entry = self.table[i]
+            return int(entry["wins"]), int(entry["draws"]), int(entry["losses"])
+        return None
+
+    # Best scoring turn by the book or None if no turn has been played often enough
+    def probe(self, game: Draughts, turns: list = None):
+        self.probes += 1
+        if turns is None:
+            turns = game.legalTurns()
+        bestturn = None
+        bestscore = -1
+        for t in turns:
+            undo = game.makeMove(t)
+            stats = self.lookup(game.hashKey())
+            game.unmakeMove(undo)
+            if stats is None or sum(stats) < self.mingames:
+                continue
+            # Stats after the turn are for the other player
+            wins, draws, losses = stats
+            score = (losses + 0.5 * draws) / (wins + draws + losses)
+            if score > bestscore:
+                bestscore = score
+                bestturn = t
+        if bestturn is not None:
+            self.hits += 1
+        return bestturn
+
+
+if __name__ == "__main__":
+    from selfplay import playGames, SearchPlayer
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    builder = BookBuilder()
+    builder.addResults(playGames(SearchPlayer(maxdepth=4), SearchPlayer(maxdepth=4), games))
+    print(f"Saved {builder.save()} positions to book.npy")
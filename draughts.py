@@ -8,38 +8,347 @@
 # win by eliminating all of your opponents pieces
 # draw if three repeat board positions or 20* consecutive moves with no pieces taken or no king promotion
 # *might change number
-# (draw logic not implemented)
+# A move here is a turn from each player so the no progress rule is 40 turns
 
+import random
 import numpy as np
+from metrics import METRICS
 
 # Global variables
 PLAYER1 = 1
 PLAYER2 = -1
 # For encoding board positions
 ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+# Draw rules
+REPETITIONS = 3
+DRAW_MOVES = 20
+
+# Bitboard layout
+# Bit s is the dark square on row s // (size / 2) counting across from the left, which matches the order of
+# encodeBoard. The tables for each board size are built once in a Geometry, the module level tables are for 8x8
+DIRECTION_XY = {"LU": (-1, -1), "LD": (-1, 1), "RU": (1, -1), "RD": (1, 1)}
+OPPOSITE = {"LU": "RD", "LD": "RU", "RU": "LD", "RD": "LU"}
+# Directions regular pieces are allowed to move in
+MAN_DIRECTIONS = {PLAYER1: ("LU", "RU"), PLAYER2: ("LD", "RD")}
+
+
+def squareIndex(x: int, y: int, size: int = 8) -> int:
+    return size // 2 * y + x // 2
+
+
+class Geometry:
+    def __init__(self, size: int = 8):
+        # Turn strings have one digit for each coordinate so the board can't be wider than 10
+        if size % 2 or not 4 <= size <= 10:
+            raise ValueError(f"Board size must be an even number from 4 to 10, not {size}")
+        self.size = size
+        self.squares = size * size // 2
+        self.full = (1 << self.squares) - 1
+        row = size // 2
+        self.square_xy = [(2 * (s % row) + (s // row) % 2, s // row) for s in range(self.squares)]
+        # Rows of regular pieces each player starts with
+        self.start_rows = (size - 2) // 2
+        # Squares where a regular piece is promoted to a king
+        self.promotion_row = {PLAYER1: sum(1 << s for s in range(row)),
+                              PLAYER2: sum(1 << s for s in range(self.squares - row, self.squares))}
+        # Zobrist keys for each piece on each square, the side key is added when it is PLAYER2 to move
+        zrandom = random.Random(2023 if size == 8 else 2023 + size)
+        self.zobrist = {p: [zrandom.getrandbits(64) for _ in range(self.squares)]
+                        for p in (PLAYER1, 2 * PLAYER1, PLAYER2, 2 * PLAYER2)}
+        self.zobrist_side = zrandom.getrandbits(64)
+        # Value of each piece on each square for PLAYER1 in units of 1 / (size - 1) of a piece, the same weights as
+        # evalBoard. Regular pieces are worth 1 plus how far they have moved up the board, kings are worth 2
+        self.unit = size - 1
+        self.piece_value = {PLAYER1: [2 * self.unit - y for x, y in self.square_xy],
+                            2 * PLAYER1: [2 * self.unit] * self.squares,
+                            PLAYER2: [-self.unit - y for x, y in self.square_xy],
+                            2 * PLAYER2: [-2 * self.unit] * self.squares}
+        self.direction_shifts = self._directionShifts()
+        # For each direction the square one step away and the landing square of a take, -1 if it is off the board
+        self.neighbour = self._stepTable(1)
+        self.jump = self._stepTable(2)
+
+    def onBoard(self, x: int, y: int) -> bool:
+        return 0 <= x < self.size and 0 <= y < self.size
+
+    # For each direction and row parity the bit shift and the squares that can shift without leaving the board
+    def _directionShifts(self) -> dict:
+        shifts = {}
+        for d, (x_, y_) in DIRECTION_XY.items():
+            rows = [[0, 0], [0, 0]]
+            for s, (x, y) in enumerate(self.square_xy):
+                if self.onBoard(x + x_, y + y_):
+                    rows[y % 2][0] = squareIndex(x + x_, y + y_, self.size) - s
+                    rows[y % 2][1] |= 1 << s
+            shifts[d] = (rows[0][0], rows[0][1], rows[1][0], rows[1][1])
+        return shifts
+
+    def _stepTable(self, steps: int) -> dict:
+        table = {}
+        for d, (x_, y_) in DIRECTION_XY.items():
+            table[d] = []
+            for x, y in self.square_xy:
+                x2 = x + steps * x_
+                y2 = y + steps * y_
+                table[d].append(squareIndex(x2, y2, self.size) if self.onBoard(x2, y2) else -1)
+        return table
+
+
+_GEOMETRIES = {}
+
+
+# Tables for a board size, made the first time the size is used
+def getGeometry(size: int = 8) -> Geometry:
+    geometry = _GEOMETRIES.get(size)
+    if geometry is None:
+        geometry = Geometry(size)
+        _GEOMETRIES[size] = geometry
+    return geometry
+
+
+GEOMETRY = getGeometry(8)
+SQUARES = GEOMETRY.squares
+FULL = GEOMETRY.full
+SQUARE_XY = GEOMETRY.square_xy
+PROMOTION_ROW = GEOMETRY.promotion_row
+ZOBRIST = GEOMETRY.zobrist
+ZOBRIST_SIDE = GEOMETRY.zobrist_side
+PIECE_VALUE = GEOMETRY.piece_value
+DIRECTION_SHIFTS = GEOMETRY.direction_shifts
+NEIGHBOUR = GEOMETRY.neighbour
+JUMP = GEOMETRY.jump
+
+
+def shiftMask(mask: int, direction: str, geometry: Geometry = GEOMETRY) -> int:
+    es, em, os, om = geometry.direction_shifts[direction]
+    e = mask & em
+    o = mask & om
+    e = e << es if es > 0 else e >> -es
+    o = o << os if os > 0 else o >> -os
+    return e | o
+
+
+def boardToBits(board, geometry: Geometry = GEOMETRY) -> tuple:
+    men = {PLAYER1: 0, PLAYER2: 0}
+    kings = {PLAYER1: 0, PLAYER2: 0}
+    for s, (x, y) in enumerate(geometry.square_xy):
+        p = board[y][x]
+        if p == PLAYER1 or p == PLAYER2:
+            men[p] |= 1 << s
+        elif p == 2 * PLAYER1 or p == 2 * PLAYER2:
+            kings[p // 2] |= 1 << s
+    return men, kings
+
+
+def hashBits(men: dict, kings: dict, geometry: Geometry = GEOMETRY) -> int:
+    h = 0
+    for player in (PLAYER1, PLAYER2):
+        for p, mask in ((player, men[player]), (2 * player, kings[player])):
+            while mask:
+                b = mask & -mask
+                mask ^= b
+                h ^= geometry.zobrist[p][b.bit_length() - 1]
+    return h
+
+
+def scoreBits(men: dict, kings: dict, geometry: Geometry = GEOMETRY) -> int:
+    score = 0
+    for player in (PLAYER1, PLAYER2):
+        for p, mask in ((player, men[player]), (2 * player, kings[player])):
+            while mask:
+                b = mask & -mask
+                mask ^= b
+                score += geometry.piece_value[p][b.bit_length() - 1]
+    return score
+
+
+def bitsToBoard(men: dict, kings: dict, geometry: Geometry = GEOMETRY) -> list:
+    board = [[0] * geometry.size for _ in range(geometry.size)]
+    for s, (x, y) in enumerate(geometry.square_xy):
+        b = 1 << s
+        for player in (PLAYER1, PLAYER2):
+            if men[player] & b:
+                board[y][x] = player
+            elif kings[player] & b:
+                board[y][x] = 2 * player
+    return board
+
+
+# Finds the squares that can move in each direction, captures are returned instead of quiet moves if there are any
+def moveMasks(men: dict, kings: dict, player: int, pieces: int = None, takes_only: bool = False,
+              geometry: Geometry = GEOMETRY) -> tuple:
+    if pieces is None:
+        pieces = geometry.full
+    opponent = PLAYER1 + PLAYER2 - player
+    opp = men[opponent] | kings[opponent]
+    empty = geometry.full & ~(opp | men[player] | kings[player])
+    own_men = men[player] & pieces
+    own_kings = kings[player] & pieces
+    takes = {}
+    any_take = 0
+    for d in DIRECTION_XY:
+        src = own_kings | own_men if d in MAN_DIRECTIONS[player] else own_kings
+        back = OPPOSITE[d]
+        takes[d] = src & shiftMask(opp & shiftMask(empty, back, geometry), back, geometry)
+        any_take |= takes[d]
+    if any_take or takes_only:
+        return True, takes
+    quiet = {}
+    for d in DIRECTION_XY:
+        src = own_kings | own_men if d in MAN_DIRECTIONS[player] else own_kings
+        quiet[d] = src & shiftMask(empty, OPPOSITE[d], geometry)
+    return False, quiet
+
+
+# Packed positions
+# A position is three 32 bit masks: PLAYER1 pieces, PLAYER2 pieces and kings of either colour
+# One position packs into a single int and arrays of positions into (n, 3) uint32 arrays
+# Other board sizes pack into an int with masks as wide as the number of squares, the arrays are only for 8x8
+_XS = np.array([x for x, y in SQUARE_XY])
+_YS = np.array([y for x, y in SQUARE_XY])
+# Piece for each letter of the default "aAbBn" string encoding
+_LETTER_VALUES = np.array([PLAYER1, 2 * PLAYER1, PLAYER2, 2 * PLAYER2, 0], dtype=np.int8)
+
+
+def packBits(men: dict, kings: dict, squares: int = SQUARES) -> int:
+    return (men[PLAYER1] | kings[PLAYER1]) | (men[PLAYER2] | kings[PLAYER2]) << squares \
+        | (kings[PLAYER1] | kings[PLAYER2]) << 2 * squares
+
+
+def unpackBits(code: int, squares: int = SQUARES) -> tuple:
+    full = (1 << squares) - 1
+    p1 = code & full
+    p2 = code >> squares & full
+    k = code >> 2 * squares & full
+    return {PLAYER1: p1 & ~k, PLAYER2: p2 & ~k}, {PLAYER1: p1 & k, PLAYER2: p2 & k}
+
+
+# (n, 32) piece values on the dark squares to (n, 3) masks
+def packPositions(values: np.ndarray) -> np.ndarray:
+    values = np.asarray(values)
+    squares = np.stack([values > 0, values < 0, np.abs(values) == 2], axis=1)
+    return np.packbits(squares, axis=2, bitorder="little").view("<u4").reshape(-1, 3).astype(np.uint32)
+
+
+def unpackPositions(packed: np.ndarray) -> np.ndarray:
+    packed = np.ascontiguousarray(packed, dtype="<u4")
+    squares = np.unpackbits(packed.view(np.uint8).reshape(-1, 3, 4), axis=2, bitorder="little").astype(np.int8)
+    return (squares[:, 0] - squares[:, 1]) * (1 + squares[:, 2])
+
+
+# Boards with shape (n, 8, 8) to packed positions and back
+def encodeBoards(boards: np.ndarray) -> np.ndarray:
+    return packPositions(np.asarray(boards)[:, _YS, _XS])
+
+
+def decodeBoards(packed: np.ndarray) -> np.ndarray:
+    values = unpackPositions(packed)
+    boards = np.zeros((len(values), 8, 8), dtype=np.int8)
+    boards[:, _YS, _XS] = values
+    return boards
+
+
+# 16 or 32 character encodeBoard strings to packed positions and back
+def encodeStrings(codes: list, letters: str = "aAbBn") -> np.ndarray:
+    length = len(codes[0])
+    chars = np.frombuffer("".join(codes).encode(), dtype=np.uint8).reshape(len(codes), length)
+    if length == 16:
+        l = chars.astype(np.int64) - ord(ALPHABET[0])
+        pieces = np.stack([l // 5, l % 5], axis=2).reshape(len(codes), SQUARES)
+    else:
+        lookup = np.zeros(256, dtype=np.int64)
+        for i, c in enumerate(letters):
+            lookup[ord(c)] = i
+        pieces = lookup[chars]
+    return packPositions(_LETTER_VALUES[pieces])
+
+
+def decodeStrings(packed: np.ndarray, letters: str = "aAbBn", lcode: bool = False) -> list:
+    values = unpackPositions(packed)
+    lookup = np.zeros(5, dtype=np.int64)
+    for i, v in enumerate(_LETTER_VALUES):
+        lookup[v] = i
+    pieces = lookup[values]
+    if lcode:
+        chars = np.frombuffer(letters.encode(), dtype=np.uint8)[pieces]
+    else:
+        pairs = pieces.reshape(len(values), SQUARES // 2, 2)
+        chars = np.frombuffer(ALPHABET.encode(), dtype=np.uint8)[5 * pairs[..., 0] + pairs[..., 1]]
+    return [row.tobytes().decode() for row in chars]
 
 
 class Draughts:
-    def __init__(self) -> None:
-        self.board = [[PLAYER2, 0, PLAYER2, 0, PLAYER2, 0, PLAYER2, 0],
-                      [0, PLAYER2, 0, PLAYER2, 0, PLAYER2, 0, PLAYER2],
-                      [PLAYER2, 0, PLAYER2, 0, PLAYER2, 0, PLAYER2, 0],
-                      [0, 0, 0, 0, 0, 0, 0, 0],
-                      [0, 0, 0, 0, 0, 0, 0, 0],
-                      [0, PLAYER1, 0, PLAYER1, 0, PLAYER1, 0, PLAYER1],
-                      [PLAYER1, 0, PLAYER1, 0, PLAYER1, 0, PLAYER1, 0],
-                      [0, PLAYER1, 0, PLAYER1, 0, PLAYER1, 0, PLAYER1]]
+    # size is the width of the board, 8 for English draughts or 10 for the international board with the same rules
+    def __init__(self, size: int = 8) -> None:
+        self.geometry = getGeometry(size)
+        self.men = {PLAYER1: 0, PLAYER2: 0}
+        self.kings = {PLAYER1: 0, PLAYER2: 0}
+        # Zobrist hash of the pieces, kept up to date by move
+        self.hash = 0
+        # Material and advancement for PLAYER1 in sevenths, kept up to date by move
+        self.score = 0
+        # Turns in a row with no takes or promotions
+        self.quiet = 0
+        # Number of times each position (hashKey) has been reached since the last move that can't be undone
+        self.history = {}
         self.turn = PLAYER1
-        self.pieces = [12, 12]
+        rows = self.geometry.start_rows
+        self.board = [[(PLAYER2 if y < rows else PLAYER1 if y >= size - rows else 0) if (x + y) % 2 == 0 else 0
+                       for x in range(size)] for y in range(size)]
         self.playing = False
         self.valid_moves = ["LU", "LD", "RU", "RD"]
 
+    # The bitboards are the real position, the list board is built when it is needed
+    @property
+    def board(self) -> list:
+        return bitsToBoard(self.men, self.kings, self.geometry)
+
+    @board.setter
+    def board(self, board) -> None:
+        self.setBits(*boardToBits(board, self.geometry))
+
+    # Puts the pieces on the board and works out everything move keeps up to date, set turn before calling
+    def setBits(self, men: dict, kings: dict) -> None:
+        self.men = dict(men)
+        self.kings = dict(kings)
+        self.hash = hashBits(self.men, self.kings, self.geometry)
+        self.score = scoreBits(self.men, self.kings, self.geometry)
+        self.pieces = [(self.men[p] | self.kings[p]).bit_count() for p in (PLAYER1, PLAYER2)]
+        self.resetHistory()
+
+    # Position key for the transposition table including the player to move
+    def hashKey(self, player: int = None) -> int:
+        if player is None:
+            player = self.turn
+        if player == PLAYER2:
+            return self.hash ^ self.geometry.zobrist_side
+        return self.hash
+
+    # Starts the draw rules again from the current position, call after changing the board or the player to move
+    def resetHistory(self) -> None:
+        self.quiet = 0
+        self.history = {self.hashKey(): 1}
+
+    def repetitions(self, player: int = None) -> int:
+        return self.history.get(self.hashKey(player), 0)
+
+    def isDraw(self, player: int = None) -> bool:
+        return self.repetitions(player) >= REPETITIONS or self.quiet >= 2 * DRAW_MOVES
+
+    # Records the position at the end of a turn, if the turn can't be undone the older positions can't come up again
+    def _recordTurn(self, player: int, irreversible: bool) -> None:
+        key = self.hashKey(PLAYER1 + PLAYER2 - player)
+        if irreversible:
+            self.history = {key: 1}
+        else:
+            self.history[key] = self.history.get(key, 0) + 1
+
     def printBoard(self, board: list = None) -> None:
         pboard = {0: "   ", PLAYER1: " a ", PLAYER2: " b ", 2 * PLAYER1: " A ", 2 * PLAYER2: " B "}
         if board is None:
             board = self.board
         yaxis = "x|"
-        for i in range(8):
+        for i in range(self.geometry.size):
             yaxis += f" {i} "
         print(yaxis + "|")
         for i, row in enumerate(board):
@@ -51,16 +360,25 @@ class Draughts:
                     rowstring += pboard[col]
             print(rowstring + "|")
 
+    # Score for the player in units of 1 / (size - 1) of a piece without scaling, for use in search
+    def evalRaw(self, player: int) -> int:
+        if METRICS.enabled:
+            METRICS.count("evals")
+        return self.score * player
+
     def evalBoard(self, player: int, board: list = None) -> float:
+        if METRICS.enabled:
+            METRICS.count("evals")
+        unit = self.geometry.unit
         if board is None:
-            board = self.board
+            return round(np.tanh(self.score * player / (4 * unit)), 2)
         score = 0
         for y, row in enumerate(board):
             for x, p in enumerate(row):
                 if p == PLAYER1:
-                    score += 1 + (7 - y) / 7
+                    score += 1 + (unit - y) / unit
                 elif p == PLAYER2:
-                    score -= 1 + y / 7
+                    score -= 1 + y / unit
                 elif p == 2 * PLAYER1:
                     score += 2
                 elif p == 2 * PLAYER2:
@@ -86,9 +404,9 @@ class Draughts:
                         longcode += letters[3]
                     elif col == 0:
                         longcode += letters[4]
-        # 16 character encoding
+        # 16 character encoding (25 for 10x10)
         shortcode = ""
-        for l in range(16):
+        for l in range(len(longcode) // 2):
             x = longcode[2 * l]
             y = longcode[2 * l + 1]
             i = 6
@@ -107,176 +425,344 @@ class Draughts:
             return shortcode
 
     def decodeBoard(self, encoding: str, letters: str = "aAbBn"):
-        newboard = []
         piece_dict = {0: PLAYER1, 1: 2 * PLAYER1, 2: PLAYER2, 3: 2 * PLAYER2, 4: 0}
-        if len(encoding) == 16:
-            for y in range(8):
-                row = []
-                for x in range(8):
-                    if y % 2 == 0 and x % 4 == 0 or y % 2 == 1 and x % 4 == 1:
-                        i = 2 * y + (x - (y % 2)) / 4
-                        e = encoding[int(i)]
-                        l = 0
-                        for j in range(25):
-                            if ALPHABET[j] == e:
-                                l = j
-                                break
-                        s1 = l // 5
-                        s2 = l % 5
-                        if y % 2 == 0:
-                            row.append(piece_dict[s1])
-                            row.append(0)
-                            row.append(piece_dict[s2])
-                            row.append(0)
-                        else:
-                            row.append(0)
-                            row.append(piece_dict[s1])
-                            row.append(0)
-                            row.append(piece_dict[s2])
-                newboard.append(row)
-        elif len(encoding) == 32:
-            for y in range(8):
-                row = []
-                for x in range(8):
-                    if (x + y) % 2 == 0:
-                        i = 4 * y + (x - (y % 2)) / 2
-                        e = encoding[int(i)]
-                        l = 0
-                        while letters[l] != e:
-                            l += 1
-                            if letters[l] == e:
-                                break
-                        row.append(piece_dict[l])
-                    else:
-                        row.append(0)
-                newboard.append(row)
+        geometry = self.geometry
+        newboard = [[0] * geometry.size for _ in range(geometry.size)]
+        # Piece on each dark square in order
+        pieces = []
+        if len(encoding) == geometry.squares // 2:
+            for e in encoding:
+                l = ALPHABET.index(e) if e in ALPHABET[:25] else 0
+                pieces += [l // 5, l % 5]
+        elif len(encoding) == geometry.squares:
+            pieces = [letters.index(e) for e in encoding]
+        else:
+            return []
+        for (x, y), l in zip(geometry.square_xy, pieces):
+            newboard[y][x] = piece_dict[l]
         return newboard
 
+    # Single position in the packed format as an int
+    def packBoard(self, board=None) -> int:
+        squares = self.geometry.squares
+        if board is None:
+            return packBits(self.men, self.kings, squares)
+        return packBits(*boardToBits(board, self.geometry), squares)
+
+    def unpackBoard(self, code: int) -> list:
+        return bitsToBoard(*unpackBits(code, self.geometry.squares), self.geometry)
+
     def isValMove(self, piece: list, move_type: str):
-        x = piece[0]
-        y = piece[1]
-        p = self.board[y][x]
-        if "L" in move_type:
-            x_ = -1
-        else:
-            x_ = 1
-        if "U" in move_type:
-            y_ = -1
-        else:
-            y_ = 1
+        geometry = self.geometry
+        sq = squareIndex(piece[0], piece[1], geometry.size)
+        b = 1 << sq
+        player = self.turn
+        opponent = PLAYER1 + PLAYER2 - player
         # Check if piece can move in that direction
-        if self.turn == (PLAYER1 + PLAYER2 + (PLAYER1 - PLAYER2) * y_) / 2 and p == self.turn:
+        if self.men[player] & b and move_type not in MAN_DIRECTIONS[player]:
             return False, False
+        t = geometry.neighbour[move_type][sq]
         # Check if piece will go off the board
-        elif x == 7 * (1 + x_) / 2 or y == 7 * (1 + y_) / 2:
+        if t < 0:
             return False, False
         # Check if move obstructed by friendly piece
-        elif self.board[y + y_][x + x_] != 0 and (self.board[y + y_][x + x_] == self.turn
-                                                  or self.board[y + y_][x + x_] == 2 * self.turn):
+        if (self.men[player] | self.kings[player]) >> t & 1:
             return False, False
         # Check if a valid take
-        elif self.board[y + y_][x + x_] in (PLAYER1 + PLAYER2 - self.turn, 2 * (PLAYER1 + PLAYER2 - self.turn)):
-            if x == (5 * x_ + 7) / 2 or y == (5 * y_ + 7) / 2 or self.board[y + 2 * y_][x + 2 * x_] != 0:
+        if (self.men[opponent] | self.kings[opponent]) >> t & 1:
+            landing = geometry.jump[move_type][sq]
+            occupied = self.men[PLAYER1] | self.kings[PLAYER1] | self.men[PLAYER2] | self.kings[PLAYER2]
+            if landing < 0 or occupied >> landing & 1:
                 return False, True
-            else:
-                return True, True
+            return True, True
         return True, False
 
-    def legalMoves(self, player: int, board: list, piece=None) -> dict:
-        legal_moves = {}
-        l_take = False
-        # Finds legal moves for a specific piece
-        if piece is not None:
-            l_take = True
-            n = []
-            for m in self.valid_moves:
-                v, t = self.isValMove(piece, m)
-                # If there is a take then the only legal moves are takes
-                if v and l_take and t:
-                    n.append(m)
-            legal_moves[f"{piece[0]}{piece[1]}"] = n
+    def legalMoves(self, player: int, board=None, piece=None) -> dict:
+        geometry = self.geometry
+        if board is None:
+            men, kings = self.men, self.kings
         else:
-            for y, row in enumerate(board):
-                for x, col in enumerate(row):
-                    if col != 0 and (col == player or col == 2 * player):
-                        p = [x, y]
-                        # List of legal moves for the piece
-                        n = []
-                        for m in self.valid_moves:
-                            v, t = self.isValMove(p, m)
-                            # If you can take you must
-                            if v and t and not l_take:
-                                # print(f"Entered loop with piece {p}, move {m}")
-                                l_take = True
-                                legal_moves = {}
-                                n = []
-                            # If there is a take then the only legal moves are takes
-                            if v and l_take and t or v and not l_take:
-                                n.append(m)
-                        if len(n) > 0:
-                            legal_moves[f"{x}{y}"] = n
+            men, kings = boardToBits(board, geometry)
+        # Finds legal moves for a specific piece, only takes are allowed
+        if piece is not None:
+            s = squareIndex(piece[0], piece[1], geometry.size)
+            _, masks = moveMasks(men, kings, player, 1 << s, True, geometry)
+            return {f"{piece[0]}{piece[1]}": [m for m in self.valid_moves if masks[m] >> s & 1]}
+        # If you can take you must
+        _, masks = moveMasks(men, kings, player, geometry=geometry)
+        movers = 0
+        for m in masks.values():
+            movers |= m
+        legal_moves = {}
+        while movers:
+            b = movers & -movers
+            movers ^= b
+            x, y = geometry.square_xy[b.bit_length() - 1]
+            legal_moves[f"{x}{y}"] = [m for m in self.valid_moves if masks[m] & b]
+        if METRICS.enabled:
+            METRICS.count("legal_moves_calls")
+            METRICS.count("legal_moves", sum(len(m) for m in legal_moves.values()))
         return legal_moves
 
     def move(self, piece: list, move_type: str, internalboard=None):
-        if internalboard is None:
-            internalboard = self.board
-        if self.isValMove(piece, move_type):
-            x = piece[0]
-            y = piece[1]
-            p = internalboard[y][x]
-            if "L" in move_type:
-                x_ = -1
-            else:
-                x_ = 1
-            if "U" in move_type:
-                y_ = -1
+        # Plays the move on a separate board by loading it into the bitboards then writing the result back
+        if internalboard is not None:
+            men, kings, h, score = self.men, self.kings, self.hash, self.score
+            history, quiet = self.history, self.quiet
+            self.board = internalboard
+            result = self.move(piece, move_type)
+            newboard = self.board
+            for y, row in enumerate(newboard):
+                for x, col in enumerate(row):
+                    internalboard[y][x] = col
+            self.men, self.kings, self.hash, self.score = men, kings, h, score
+            self.history, self.quiet = history, quiet
+            return result
+        geometry = self.geometry
+        zobrist = geometry.zobrist
+        value = geometry.piece_value
+        sq = squareIndex(piece[0], piece[1], geometry.size)
+        b = 1 << sq
+        player = self.turn
+        opponent = PLAYER1 + PLAYER2 - player
+        # Checks players piece is being moved
+        if self.men[player] & b:
+            pieces = self.men
+            p = player
+        elif self.kings[player] & b:
+            pieces = self.kings
+            p = 2 * player
+        else:
+            return 1, None
+        t = geometry.neighbour[move_type][sq]
+        if t < 0:
+            return 1, None
+        target = 1 << t
+        occupied = self.men[PLAYER1] | self.kings[PLAYER1] | self.men[PLAYER2] | self.kings[PLAYER2]
+        # Empty Square
+        if not occupied & target:
+            zfrom = zobrist[p][sq]
+            self.score -= value[p][sq]
+            pieces[player] ^= b
+            # Checks for king promotion
+            if pieces is self.men and target & geometry.promotion_row[player]:
+                self.kings[player] |= target
+                p = 2 * player
+                self.quiet = 0
             else:
-                y_ = 1
-            # Checks players piece is being moved
-            if p == self.turn or p == 2 * self.turn:
-                # Empty Square
-                if internalboard[y + y_][x + x_] == 0:
-                    # Checks for king promotion
-                    if y == (5 * self.turn + PLAYER2 - 6 * PLAYER1) / (PLAYER2 - PLAYER1) and p in (PLAYER1, PLAYER2):
-                        internalboard[y + y_][x + x_] = p * 2
-                    else:
-                        internalboard[y + y_][x + x_] = p
-                    # Turn current square to empty
-                    internalboard[y][x] = 0
-                    return 0, [x + x_, y + y_]
-                # Taking a piece with a normal piece
-                elif p in (PLAYER1, PLAYER2):
-                    internalboard[y + y_][x + x_] = 0
-                    self.pieces[round((PLAYER2 - self.turn) / (PLAYER2 - PLAYER1))] -= 1
-                    # Checks for king promotion
-                    if p == PLAYER1 and y + 2 * y_ == 0 or p == PLAYER2 and y + 2 * y_ == 7:
-                        internalboard[y + 2 * y_][x + 2 * x_] = p * 2
-                    else:
-                        internalboard[y + 2 * y_][x + 2 * x_] = p
-                    # Turn current square to empty
-                    internalboard[y][x] = 0
-                    # Find the new legal moves
-                    l_m = self.legalMoves(self.turn, internalboard, [x + 2 * x_, y + 2 * y_])
-                    n = l_m[f"{x + 2 * x_}{y + 2 * y_}"]
-                    if len(n) == 0:
-                        return 0, [x + 2 * x_, y + 2 * y_]
+                pieces[player] |= target
+                self.quiet += 1
+            self.hash ^= zfrom ^ zobrist[p][t]
+            self.score += value[p][t]
+            # Regular pieces can't move backwards so their moves can't be undone
+            self._recordTurn(player, pieces is self.men)
+            x, y = geometry.square_xy[t]
+            return 0, [x, y]
+        # Taking a piece
+        l = geometry.jump[move_type][sq]
+        if l < 0 or occupied >> l & 1:
+            return 1, None
+        landing = 1 << l
+        zfrom = zobrist[p][sq]
+        self.score -= value[p][sq]
+        if self.men[opponent] & target:
+            self.men[opponent] ^= target
+            self.hash ^= zobrist[opponent][t]
+            self.score -= value[opponent][t]
+        else:
+            self.kings[opponent] ^= target
+            self.hash ^= zobrist[2 * opponent][t]
+            self.score -= value[2 * opponent][t]
+        self.pieces[round((PLAYER2 - player) / (PLAYER2 - PLAYER1))] -= 1
+        pieces[player] ^= b
+        # Checks for king promotion
+        if pieces is self.men and landing & geometry.promotion_row[player]:
+            self.kings[player] |= landing
+            p = 2 * player
+        else:
+            pieces[player] |= landing
+        self.hash ^= zfrom ^ zobrist[p][l]
+        self.score += value[p][l]
+        self.quiet = 0
+        x, y = geometry.square_xy[l]
+        # Find the new legal moves
+        _, masks = moveMasks(self.men, self.kings, player, landing, True, geometry)
+        for m in masks.values():
+            if m:
+                return 1, [x, y]
+        self._recordTurn(player, True)
+        return 0, [x, y]
+
+    def getState(self) -> tuple:
+        return (dict(self.men), dict(self.kings), list(self.pieces), self.turn, self.hash, self.score, self.quiet,
+                dict(self.history))
+
+    def setState(self, state: tuple) -> None:
+        men, kings, pieces, turn, h, score, quiet, history = state
+        self.men = dict(men)
+        self.kings = dict(kings)
+        self.pieces = list(pieces)
+        self.turn = turn
+        self.hash = h
+        self.score = score
+        self.quiet = quiet
+        self.history = dict(history)
+
+    # A turn is the starting square followed by every direction moved e.g. "52RU" or "25RDLD"
+    def legalTurns(self, player: int = None) -> list:
+        turns = list(self.generateTurns(player))
+        if METRICS.enabled:
+            METRICS.count("legal_turns_calls")
+            METRICS.count("legal_turns", len(turns))
+        return turns
+
+    # Yields every complete turn, multiple takes are followed depth first on the bitboards without moving any pieces
+    def generateTurns(self, player: int = None):
+        if player is None:
+            player = self.turn
+        opponent = PLAYER1 + PLAYER2 - player
+        geometry = self.geometry
+        take, masks = moveMasks(self.men, self.kings, player, geometry=geometry)
+        movers = 0
+        for m in masks.values():
+            movers |= m
+        opp = self.men[opponent] | self.kings[opponent]
+        empty = geometry.full & ~(opp | self.men[player] | self.kings[player])
+        promotion = geometry.promotion_row[player]
+        while movers:
+            b = movers & -movers
+            movers ^= b
+            sq = b.bit_length() - 1
+            x, y = geometry.square_xy[sq]
+            king = self.kings[player] & b != 0
+            for d in self.valid_moves:
+                if masks[d] & b:
+                    if take:
+                        t = 1 << geometry.neighbour[d][sq]
+                        l = geometry.jump[d][sq]
+                        yield from self._takeTurns(l, king or promotion >> l & 1, player, opp ^ t,
+                                                   (empty | b | t) ^ 1 << l, f"{x}{y}{d}")
                     else:
-                        return 1, [x + 2 * x_, y + 2 * y_]
-                # Taking a piece with a king
+                        yield f"{x}{y}{d}"
+
+    # Taken pieces are removed straight away so their squares count as empty for the rest of the turn
+    def _takeTurns(self, sq: int, king: bool, player: int, opp: int, empty: int, path: str):
+        finished = True
+        geometry = self.geometry
+        for d in self.valid_moves if king else MAN_DIRECTIONS[player]:
+            t = geometry.neighbour[d][sq]
+            l = geometry.jump[d][sq]
+            if l >= 0 and opp >> t & 1 and empty >> l & 1:
+                finished = False
+                yield from self._takeTurns(l, king or geometry.promotion_row[player] >> l & 1, player, opp ^ 1 << t,
+                                           (empty | 1 << sq | 1 << t) ^ 1 << l, path + d)
+        if finished:
+            yield path
+
+    # Plays a whole turn then passes the move to the other player
+    # Returns an undo record for unmakeMove: (start, end, was a king, promoted, taken pieces, hash, score, player,
+    # quiet turns, positions before the turn if they were cleared)
+    def makeMove(self, turn: str) -> tuple:
+        player = self.turn
+        opponent = PLAYER1 + PLAYER2 - player
+        geometry = self.geometry
+        zobrist = geometry.zobrist
+        value = geometry.piece_value
+        neighbour = geometry.neighbour
+        sq = squareIndex(int(turn[0]), int(turn[1]), geometry.size)
+        start = 1 << sq
+        king = self.kings[player] & start != 0
+        pieces = self.kings if king else self.men
+        pieces[player] ^= start
+        h = self.hash
+        score = self.score
+        p = 2 * player if king else player
+        self.hash ^= zobrist[p][sq]
+        self.score -= value[p][sq]
+        opp = self.men[opponent] | self.kings[opponent]
+        # Each taken piece is stored as (square, was a king)
+        taken = []
+        promoted = False
+        for i in range(2, len(turn), 2):
+            d = turn[i:i + 2]
+            t = neighbour[d][sq]
+            b = 1 << t
+            if opp & b:
+                if self.men[opponent] & b:
+                    self.men[opponent] ^= b
+                    self.hash ^= zobrist[opponent][t]
+                    self.score -= value[opponent][t]
+                    taken.append((b, False))
                 else:
-                    internalboard[y + y_][x + x_] = 0
-                    self.pieces[round((PLAYER2 - self.turn) / (PLAYER2 - PLAYER1))] -= 1
-                    internalboard[y + 2 * y_][x + 2 * x_] = p
-                    # Turn current square to empty
-                    internalboard[y][x] = 0
-                    # Find the new legal moves
-                    l_m = self.legalMoves(self.turn, internalboard, [x + 2 * x_, y + 2 * y_])
-                    n = l_m[f"{x + 2 * x_}{y + 2 * y_}"]
-                    if len(n) == 0:
-                        return 0, [x + 2 * x_, y + 2 * y_]
-                    else:
-                        return 1, [x + 2 * x_, y + 2 * y_]
-        return 1, None
+                    self.kings[opponent] ^= b
+                    self.hash ^= zobrist[2 * opponent][t]
+                    self.score -= value[2 * opponent][t]
+                    taken.append((b, True))
+                opp ^= b
+                t = geometry.jump[d][sq]
+            sq = t
+            # A piece promoted part way through a take carries on as a king
+            if not king and geometry.promotion_row[player] >> sq & 1:
+                promoted = True
+        b = 1 << sq
+        p = 2 * player if king or promoted else player
+        if king or promoted:
+            self.kings[player] |= b
+        else:
+            self.men[player] |= b
+        self.hash ^= zobrist[p][sq]
+        self.score += value[p][sq]
+        if taken:
+            self.pieces[round((PLAYER2 - player) / (PLAYER2 - PLAYER1))] -= len(taken)
+        self.turn = opponent
+        quiet = self.quiet
+        history = None
+        if taken or promoted:
+            self.quiet = 0
+        else:
+            self.quiet += 1
+        key = self.hashKey()
+        # Regular pieces can't move backwards so their moves can't be undone
+        if taken or not king:
+            history = self.history
+            self.history = {key: 1}
+        else:
+            self.history[key] = self.history.get(key, 0) + 1
+        return start, b, king, promoted, taken, h, score, player, quiet, history
+
+    def unmakeMove(self, undo: tuple) -> None:
+        start, end, king, promoted, taken, h, score, player, quiet, history = undo
+        if history is None:
+            key = self.hashKey()
+            if self.history[key] == 1:
+                del self.history[key]
+            else:
+                self.history[key] -= 1
+        else:
+            self.history = history
+        self.quiet = quiet
+        opponent = PLAYER1 + PLAYER2 - player
+        if king or promoted:
+            self.kings[player] ^= end
+        else:
+            self.men[player] ^= end
+        if king:
+            self.kings[player] |= start
+        else:
+            self.men[player] |= start
+        for b, k in taken:
+            if k:
+                self.kings[opponent] |= b
+            else:
+                self.men[opponent] |= b
+        if taken:
+            self.pieces[round((PLAYER2 - player) / (PLAYER2 - PLAYER1))] += len(taken)
+        self.hash = h
+        self.score = score
+        self.turn = player
+
+    def playTurn(self, turn: str) -> None:
+        self.makeMove(turn)
 
     def playGame(self) -> None:
         self.playing = True
@@ -292,7 +778,7 @@ class Draughts:
             print(f"===== Player {self.turn} Turn {turn_count} Eval: {self.evalBoard(self.turn)} =====")
             self.printBoard()
             while avail_moves != 0:
-                l_m = self.legalMoves(self.turn, self.board, p)
+                l_m = self.legalMoves(self.turn, None, p)
                 # If player has no legal moves then skip turn
                 if len(l_m) == 0:
                     print(f"No move info: p={p}, l_m={l_m}")
@@ -336,6 +822,13 @@ class Draughts:
             if self.pieces[round((self.turn - PLAYER1) / (PLAYER2 - PLAYER1))] == 0:
                 print(f"Game over player {PLAYER1 + PLAYER2 - self.turn} wins!")
                 self.playing = False
+            # Draw by repetition or too many turns without a take or promotion
+            elif self.isDraw(PLAYER1 + PLAYER2 - self.turn):
+                if self.repetitions(PLAYER1 + PLAYER2 - self.turn) >= REPETITIONS:
+                    print("Match ends in a draw by threefold repetition")
+                else:
+                    print(f"Match ends in a draw after {DRAW_MOVES} moves with no takes or promotions")
+                self.playing = False
             # Draw if both players have no legal moves (goes through two full cycles to make double sure)
             elif nlm == 4:
                 print("Match ends in a draw because there are no legal moves for both players")
@@ -345,22 +838,16 @@ class Draughts:
                 self.turn = PLAYER1 + PLAYER2 - self.turn
         print(f"Evaluation History: {evalhist}")
 
-    def getPossBoards(self, encodedboard: str, player: int) -> dict:
-        defboard = self.decodeBoard(encodedboard)
-        newboards = {}
-        p = None
-        avail_moves = 1
-        lm = self.legalMoves(player, defboard, p)
-        for piece in lm:
-            for direction in lm[piece]:
-                simboard = np.copy(defboard)
-                newmove = piece + dir
-                while avail_moves != 0:
-                    avail_moves, p = self.move([int(piece[0]), int(piece[1])], direction, simboard)
-                    # Trying to figure out what to do with multiple moves in a turn
-                newboards[newmove] = self.encodeBoard(simboard)
-
-        return newboards
+    # Yields each full turn for the player with the encoding of the board after it
+    def getPossBoards(self, encodedboard: str, player: int):
+        game = Draughts(self.geometry.size)
+        game.board = self.decodeBoard(encodedboard)
+        game.turn = player
+        game.resetHistory()
+        for turn in game.legalTurns():
+            undo = game.makeMove(turn)
+            yield turn, game.encodeBoard()
+            game.unmakeMove(undo)
 
 
 if __name__ == "__main__":
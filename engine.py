@@ -0,0 +1,257 @@
+# Line based engine protocol over stdin/stdout, loosely following UCI
+# The search runs in a worker thread under asyncio so commands are still read while it is thinking
+#
+# Commands:
+#   draughts                                  -> id lines then draughtsok
+#   isready                                   -> readyok
+#   newgame [size]                            clears the transposition table and goes back to the start,
+#                                             optionally on a board of a different size
+#   position startpos [moves t1 t2 ...]
+#   position <encodeBoard string> <player> [moves t1 t2 ...]   player is 1 or -1, a pass is written as "pass"
+#   go [depth n] [nodes n] [movetime ms] [time ms] [inc ms] [infinite] [ponder]
+#   stop                                      ends the search and prints bestmove
+#   ponderhit                                 the predicted move was played, the ponder search carries on as normal
+#   quit
+# Output:
+#   info depth <d> score <centipieces | win n | loss n> nodes <n> time <ms> nps <n> pv <turns>
+#   bestmove <turn | pass | none> [ponder <turn>]
+import asyncio
+import sys
+import time
+from draughts import Draughts, PLAYER1, PLAYER2
+from search import Search, TranspositionTable, WIN
+
+NAME = "draughts alpha-beta"
+# Share of the remaining time used for one move when the controller only gives the clock
+MOVES_TO_GO = 30
+
+
+def turnToText(turn: str) -> str:
+    return "pass" if turn == "" else turn
+
+
+def textToTurn(text: str) -> str:
+    return "" if text == "pass" else text
+
+
+def scoreText(score: float, unit: int = 7) -> str:
+    if score > WIN / 2:
+        return f"win {WIN - score}"
+    if score < -WIN / 2:
+        return f"loss {WIN + score}"
+    # Scores are in fractions of a piece, 1 / unit
+    return f"{round(score * 100 / unit)}"
+
+
+class Engine:
+    def __init__(self, ttsize: int = 1 << 20, tablebase=None, output=None, size: int = 8):
+        self.size = size
+        self.game = Draughts(size)
+        self.search = Search(self.game, TranspositionTable(ttsize), tablebase)
+        # Called with each line of output, prints by default
+        self.output = output if output is not None else self.send
+        self.task = None
+        self.loop = None
+        # Limits for the search started by go ponder, used once the ponder move is played
+        self.pondering = False
+        self.ponderlimits = None
+        self.ponderhit = None
+
+    @staticmethod
+    def send(line: str) -> None:
+        print(line, flush=True)
+
+    # Runs commands from stdin until quit or the end of the input
+    async def run(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        while True:
+            line = await self.loop.run_in_executor(None, sys.stdin.readline)
+            if not line or not await self.handle(line):
+                break
+        await self.stopSearch()
+
+    # Returns False once the engine should exit
+    async def handle(self, line: str) -> bool:
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        words = line.split()
+        if not words:
+            return True
+        command, args = words[0], words[1:]
+        if command == "quit":
+            return False
+        # A bad command is reported and the engine carries on
+        try:
+            await self.command(command, args)
+        except Exception as e:
+            self.output(f"info string error in {command}: {e}")
+        return True
+
+    async def command(self, command: str, args: list) -> None:
+        if command == "draughts":
+            self.output(f"id name {NAME}")
+            self.output("draughtsok")
+        elif command == "isready":
+            self.output("readyok")
+        elif command == "newgame":
+            await self.stopSearch()
+            self.search.tt.clear()
+            size = self.size
+            if args:
+                try:
+                    size = int(args[0])
+                except ValueError:
+                    self.output(f"info string board size {args[0]} is not a number")
+                    return
+            self.game = Draughts(size)
+            self.size = size
+            self.search.game = self.game
+        elif command == "position":
+            await self.stopSearch()
+            self.setPosition(args)
+        elif command == "go":
+            await self.stopSearch()
+            self.go(args)
+        elif command == "stop":
+            await self.stopSearch()
+        elif command == "ponderhit":
+            self.ponderHit()
+        else:
+            self.output(f"info string unknown command {command}")
+
+    def setPosition(self, args: list) -> None:
+        game = Draughts(self.size)
+        if args and args[0] == "startpos":
+            rest = args[1:]
+        elif len(args) >= 2:
+            board = game.decodeBoard(args[0])
+            if not board:
+                squares = game.geometry.squares
+                self.output(f"info string position encoding needs {squares // 2} or {squares} characters")
+                return
+            if args[1] not in (str(PLAYER1), str(PLAYER2)):
+                self.output(f"info string player must be {PLAYER1} or {PLAYER2}, not {args[1]}")
+                return
+            game.turn = int(args[1])
+            game.board = board
+            rest = args[2:]
+        else:
+            self.output("info string position needs startpos or an encoding and a player")
+            return
+        if rest and rest[0] == "moves":
+            for text in rest[1:]:
+                turn = textToTurn(text)
+                turns = game.legalTurns()
+                if turn == "" and not turns:
+                    game.turn = PLAYER1 + PLAYER2 - game.turn
+                elif turn in turns:
+                    game.makeMove(turn)
+                else:
+                    self.output(f"info string illegal move {text}")
+                    return
+        self.game = game
+        self.search.game = game
+
+    @staticmethod
+    def parseLimits(args: list) -> dict:
+        limits = {"depth": 64, "nodes": None, "movetime": None, "time": None, "inc": 0, "infinite": False,
+                  "ponder": False}
+        i = 0
+        while i < len(args):
+            name = args[i]
+            if name in ("infinite", "ponder"):
+                limits[name] = True
+                i += 1
+            elif name in limits and i + 1 < len(args):
+                try:
+                    limits[name] = int(args[i + 1])
+                except ValueError:
+                    raise ValueError(f"{name} needs a whole number, not {args[i + 1]}")
+                i += 2
+            else:
+                i += 1
+        return limits
+
+    # Seconds to spend on the move, None for no time limit
+    @staticmethod
+    def moveTime(limits: dict):
+        if limits["infinite"]:
+            return None
+        if limits["movetime"] is not None:
+            return limits["movetime"] / 1000
+        if limits["time"] is not None:
+            return min(limits["time"] / MOVES_TO_GO + limits["inc"] / 2, limits["time"] / 2) / 1000
+        return None
+
+    def go(self, args: list) -> None:
+        limits = self.parseLimits(args)
+        self.pondering = limits["ponder"]
+        self.ponderlimits = limits
+        self.ponderhit = asyncio.Event()
+        if self.pondering:
+            # Thinks with no limits until ponderhit or stop
+            self.task = self.loop.create_task(self.think(limits["depth"], None, None))
+        else:
+            self.task = self.loop.create_task(self.think(limits["depth"], limits["nodes"], self.moveTime(limits)))
+
+    async def think(self, depth: int, nodes, movetime) -> None:
+        turns = self.game.legalTurns()
+        if len(turns) <= 1 and not self.pondering:
+            bestturn, pv = (turns[0], turns[:1]) if turns else (None, [])
+        else:
+            bestturn, pv, _ = await self.loop.run_in_executor(None, self.search.bestMove, depth, nodes, movetime,
+                                                              False, self.info)
+            if bestturn is None and turns:
+                bestturn = turns[0]
+        # Results from pondering are held back until the opponent has moved
+        if self.pondering:
+            await self.ponderhit.wait()
+        if bestturn is None:
+            self.output("bestmove none")
+        elif len(pv) > 1 and pv[0] == bestturn:
+            self.output(f"bestmove {turnToText(bestturn)} ponder {turnToText(pv[1])}")
+        else:
+            self.output(f"bestmove {turnToText(bestturn)}")
+
+    # Called from the search thread after each finished iteration
+    def info(self, depth: int, score: float, nodes: int, seconds: float, pv: list) -> None:
+        nps = round(nodes / seconds) if seconds > 0 else 0
+        score = scoreText(score, self.game.geometry.unit)
+        line = (f"info depth {depth} score {score} nodes {nodes} time {round(seconds * 1000)} nps {nps} "
+                f"pv {' '.join(turnToText(t) for t in pv)}")
+        self.loop.call_soon_threadsafe(self.output, line)
+
+    def ponderHit(self) -> None:
+        if self.task is None or not self.pondering:
+            return
+        limits = self.ponderlimits
+        movetime = self.moveTime(limits)
+        # The running search picks up the new limits on its next node
+        if movetime is not None:
+            self.search.deadline = time.time() + movetime
+        if limits["nodes"] is not None:
+            self.search.maxnodes = self.search.nodes + limits["nodes"]
+        self.pondering = False
+        self.ponderhit.set()
+
+    # Stops any search and waits for its bestmove to be sent
+    async def stopSearch(self) -> None:
+        if self.task is None:
+            return
+        task = self.task
+        self.task = None
+        self.pondering = False
+        self.ponderhit.set()
+        # Keeps stopping in case the stop came before the search thread started
+        while not task.done():
+            self.search.stop()
+            await asyncio.wait({task}, timeout=0.01)
+        await task
+
+
+if __name__ == "__main__":
+    tb = None
+    if len(sys.argv) > 1:
+        from tablebase import Tablebase
+        tb = Tablebase(sys.argv[1])
+    asyncio.run(Engine(tablebase=tb).run())
@@ -0,0 +1,344 @@
+# Monte Carlo tree search for draughts guided by a policy/value network, following the design in nac.py
+# An action is a full turn (legalTurns) and nodes are stored by position key (hashKey) so transpositions share
+# their statistics. Leaves are collected with virtual loss and evaluated in batches with one network call
+import math
+import random
+import time
+import numpy as np
+from draughts import Draughts, PLAYER1, PLAYER2, SQUARES, DRAW_MOVES, PIECE_VALUE, OPPOSITE, squareIndex
+from metrics import METRICS
+
+DIRECTIONS = ["LU", "LD", "RU", "RD"]
+# Network inputs are the men and kings of the player to move then of the opponent, one plane of 32 squares each
+FEATURES = 4 * SQUARES
+# One policy output for the first step of a turn (square and direction) and then the value
+POLICY_SIZE = len(DIRECTIONS) * SQUARES
+
+
+def _bitsToPlane(bits: int, flip: bool) -> list:
+    plane = [0.0] * SQUARES
+    while bits:
+        b = bits & -bits
+        bits ^= b
+        s = b.bit_length() - 1
+        plane[SQUARES - 1 - s if flip else s] = 1.0
+    return plane
+
+
+# Inputs are from the side of the player to move, for PLAYER2 the board is turned round so they also move up
+def positionFeatures(game: Draughts) -> np.ndarray:
+    player = game.turn
+    opponent = PLAYER1 + PLAYER2 - player
+    flip = player == PLAYER2
+    return np.array(_bitsToPlane(game.men[player], flip) + _bitsToPlane(game.kings[player], flip) +
+                    _bitsToPlane(game.men[opponent], flip) + _bitsToPlane(game.kings[opponent], flip),
+                    dtype=np.float32)
+
+
+# Policy index of the first step of a turn, turned round in the same way as the features
+def turnIndex(turn: str, player: int) -> int:
+    s = squareIndex(int(turn[0]), int(turn[1]))
+    d = turn[2:4]
+    if player == PLAYER2:
+        s = SQUARES - 1 - s
+        d = OPPOSITE[d]
+    return len(DIRECTIONS) * s + DIRECTIONS.index(d)
+
+
+# Fully connected network in NumPy, called with a batch of features and returning (policy logits, values)
+class NumpyNetwork:
+    def __init__(self, weights: list):
+        # List of (W, b), ReLU between layers, the last layer gives the policy logits and then the value
+        self.weights = weights
+
+    @classmethod
+    def random(cls, hidden: list = None, seed: int = None):
+        if hidden is None:
+            hidden = [128]
+        rng = np.random.default_rng(seed)
+        sizes = [FEATURES] + hidden + [POLICY_SIZE + 1]
+        weights = [(rng.normal(0, math.sqrt(2 / a), (a, b)).astype(np.float32), np.zeros(b, dtype=np.float32))
+                   for a, b in zip(sizes, sizes[1:])]
+        return cls(weights)
+
+    # Single layer network whose value is evalBoard and whose policy is flat
+    @classmethod
+    def material(cls):
+        w = np.zeros((FEATURES, POLICY_SIZE + 1), dtype=np.float32)
+        w[:SQUARES, -1] = PIECE_VALUE[PLAYER1]
+        w[SQUARES:2 * SQUARES, -1] = PIECE_VALUE[2 * PLAYER1]
+        w[2 * SQUARES:3 * SQUARES, -1] = PIECE_VALUE[PLAYER2]
+        w[3 * SQUARES:, -1] = PIECE_VALUE[2 * PLAYER2]
+        return cls([(w / 28, np.zeros(POLICY_SIZE + 1, dtype=np.float32))])
+
+    @classmethod
+    def load(cls, path: str):
+        data = np.load(path)
+        return cls([(data[f"w{i}"], data[f"b{i}"]) for i in range(len(data.files) // 2)])
+
+    def save(self, path: str) -> None:
+        arrays = {}
+        for i, (w, b) in enumerate(self.weights):
+            arrays[f"w{i}"] = w
+            arrays[f"b{i}"] = b
+        np.savez(path, **arrays)
+
+    def __call__(self, x: np.ndarray) -> tuple:
+        for w, b in self.weights[:-1]:
+            x = np.maximum(x @ w + b, 0)
+        w, b = self.weights[-1]
+        out = x @ w + b
+        return out[:, :POLICY_SIZE], np.tanh(out[:, POLICY_SIZE])
+
+
+# Wraps a Keras model with FEATURES inputs and either one output of POLICY_SIZE + 1 (the last being the value)
+# or two outputs (policy logits, value)
+class KerasNetwork:
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, x: np.ndarray) -> tuple:
+        out = self.model(x, training=False)
+        if isinstance(out, (list, tuple)):
+            return np.asarray(out[0]), np.asarray(out[1]).reshape(-1)
+        out = np.asarray(out)
+        return out[:, :POLICY_SIZE], out[:, POLICY_SIZE]
+
+
+class Node:
+    def __init__(self):
+        self.visits = 0
+        # Sum of the values for the player who moved into this position
+        self.value = 0.0
+        self.expanded = False
+        self.turns = []
+        self.childkeys = []
+        self.priors = None
+
+
+class MCTS:
+    def __init__(self, network=None, batchsize: int = 16, cpuct: float = 1.5, virtualloss: int = 1,
+                 noise: float = 0.0, alpha: float = 0.3):
+        if network is None:
+            network = NumpyNetwork.material()
+        self.network = network
+        # Number of leaves evaluated together
+        self.batchsize = batchsize
+        self.cpuct = cpuct
+        self.virtualloss = virtualloss
+        # Dirichlet noise mixed into the root priors for self-play
+        self.noise = noise
+        self.alpha = alpha
+        self.nodes = {}
+
+    def clear(self) -> None:
+        self.nodes = {}
+
+    def getNode(self, key: int) -> Node:
+        node = self.nodes.get(key)
+        if node is None:
+            node = Node()
+            self.nodes[key] = node
+        return node
+
+    # Value for the player to move if the game is over or a draw by the search rules, otherwise None
+    @staticmethod
+    def terminalValue(game: Draughts, ply: int, passed: bool):
+        player = game.turn
+        if game.men[player] | game.kings[player] == 0:
+            return -1.0
+        if ply > 0 and (game.repetitions() > 1 or game.quiet >= 2 * DRAW_MOVES):
+            return 0.0
+        if passed and len(game.legalTurns()) == 0:
+            return 0.0
+        return None
+
+    def expand(self, node: Node, game: Draughts, logits: np.ndarray) -> None:
+        turns = game.legalTurns()
+        player = game.turn
+        if turns:
+            p = np.array([logits[turnIndex(t, player)] for t in turns])
+            p = np.exp(p - p.max())
+            node.priors = p / p.sum()
+            node.childkeys = []
+            for t in turns:
+                undo = game.makeMove(t)
+                node.childkeys.append(game.hashKey())
+                game.unmakeMove(undo)
+        else:
+            # The only action is to forfeit the turn
+            turns = [""]
+            node.priors = np.ones(1)
+            node.childkeys = [game.hashKey(PLAYER1 + PLAYER2 - player)]
+        node.turns = turns
+        node.expanded = True
+
+    def select(self, node: Node) -> int:
+        n = np.empty(len(node.childkeys))
+        q = np.zeros(len(node.childkeys))
+        for i, k in enumerate(node.childkeys):
+            child = self.nodes.get(k)
+            if child is None or child.visits == 0:
+                n[i] = 0
+            else:
+                n[i] = child.visits
+                q[i] = child.value / child.visits
+        u = q + self.cpuct * node.priors * math.sqrt(max(1, node.visits)) / (1 + n)
+        return int(np.argmax(u))
+
+    # Walks down to a leaf adding virtual loss, returns the path of keys, the leaf value if it is terminal
+    # and the moves made so they can be taken back
+    def selectLeaf(self, game: Draughts) -> tuple:
+        key = game.hashKey()
+        path = [key]
+        undos = []
+        passed = False
+        node = self.getNode(key)
+        node.visits += self.virtualloss
+        while True:
+            value = self.terminalValue(game, len(undos), passed)
+            if value is not None or not node.expanded:
+                return path, value, undos
+            i = self.select(node)
+            turn = node.turns[i]
+            if turn == "":
+                game.turn = PLAYER1 + PLAYER2 - game.turn
+                undos.append(None)
+                passed = True
+            else:
+                undos.append(game.makeMove(turn))
+                passed = False
+            key = node.childkeys[i]
+            path.append(key)
+            node = self.getNode(key)
+            node.visits += self.virtualloss
+            node.value -= self.virtualloss
+
+    @staticmethod
+    def takeBack(game: Draughts, undos: list) -> None:
+        for undo in reversed(undos):
+            if undo is None:
+                game.turn = PLAYER1 + PLAYER2 - game.turn
+            else:
+                game.unmakeMove(undo)
+
+    # Removes the virtual loss on the path and adds the leaf value, which is for the player to move at the leaf
+    def backup(self, path: list, value: float) -> None:
+        for i in range(len(path) - 1, -1, -1):
+            node = self.nodes[path[i]]
+            node.visits += 1 - self.virtualloss
+            # The value is stored for the player who moved into the node
+            node.value += -value if (len(path) - 1 - i) % 2 == 0 else value
+            if i > 0:
+                node.value += self.virtualloss
+
+    def evaluate(self, features: list) -> tuple:
+        x = np.stack(features)
+        if not METRICS.enabled:
+            return self.network(x)
+        with METRICS.timer("nn"):
+            logits, values = self.network(x)
+        METRICS.count("nn_calls")
+        METRICS.count("nn_positions", len(features))
+        return logits, values
+
+    def addNoise(self, node: Node) -> None:
+        noise = np.random.dirichlet([self.alpha] * len(node.priors))
+        node.priors = (1 - self.noise) * node.priors + self.noise * noise
+
+    # Runs the search from the game position and returns the visit count of each turn
+    def search(self, game: Draughts, iterations: int) -> dict:
+        # The network inputs and policy outputs are laid out for the 32 squares of the 8x8 board
+        if game.geometry.squares != SQUARES:
+            raise ValueError(f"MCTS only plays on the 8x8 board, not {game.geometry.size}x{game.geometry.size}")
+        t0 = time.perf_counter()
+        # The tree is kept between moves so only the nodes added by this search are counted
+        nodes0 = len(self.nodes)
+        rootkey = game.hashKey()
+        root = self.getNode(rootkey)
+        if not root.expanded:
+            logits, _ = self.evaluate([positionFeatures(game)])
+            self.expand(root, game, logits[0])
+        if self.noise > 0:
+            self.addNoise(root)
+        done = 0
+        while done < iterations:
+            # Leaves waiting for the network by key, with every path that reached them
+            pending = {}
+            for _ in range(min(self.batchsize, iterations - done)):
+                path, value, undos = self.selectLeaf(game)
+                done += 1
+                if value is not None:
+                    self.backup(path, value)
+                elif path[-1] in pending:
+                    pending[path[-1]][2].append(path)
+                else:
+                    pending[path[-1]] = (positionFeatures(game), game.getState(), [path])
+                self.takeBack(game, undos)
+            if not pending:
+                continue
+            logits, values = self.evaluate([p[0] for p in pending.values()])
+            state = game.getState()
+            for i, (key, (_, leafstate, paths)) in enumerate(pending.items()):
+                node = self.nodes[key]
+                if not node.expanded:
+                    game.setState(leafstate)
+                    self.expand(node, game, logits[i])
+                for path in paths:
+                    self.backup(path, float(values[i]))
+            game.setState(state)
+        if METRICS.enabled:
+            METRICS.count("mcts_searches")
+            METRICS.count("mcts_iterations", iterations)
+            METRICS.count("mcts_nodes", len(self.nodes) - nodes0)
+            METRICS.addTime("mcts", time.perf_counter() - t0)
+        visits = {}
+        for t, k in zip(root.turns, root.childkeys):
+            child = self.nodes.get(k)
+            visits[t] = 0 if child is None else child.visits
+        return visits
+
+    # Most visited turn, or with a temperature a turn picked in proportion to visits^(1/temperature)
+    def bestMove(self, game: Draughts, iterations: int, temperature: float = 0) -> str:
+        visits = self.search(game, iterations)
+        turns = list(visits)
+        if temperature == 0:
+            return max(turns, key=lambda t: visits[t])
+        weights = [visits[t] ** (1 / temperature) for t in turns]
+        if sum(weights) == 0:
+            return random.choice(turns)
+        return random.choices(turns, weights)[0]
+
+
+# Player for selfplay.py and tournament.py
+class MCTSPlayer:
+    def __init__(self, iterations: int = 200, network=None, batchsize: int = 16, temperature: float = 0,
+                 maxnodes: int = 200000):
+        self.iterations = iterations
+        self.network = network
+        self.batchsize = batchsize
+        self.temperature = temperature
+        # The tree is kept between turns until it has this many nodes
+        self.maxnodes = maxnodes
+        self.mcts = None
+
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        state["mcts"] = None
+        return state
+
+    def __call__(self, game: Draughts, turns: list) -> str:
+        if len(turns) == 1:
+            return turns[0]
+        if self.mcts is None:
+            self.mcts = MCTS(self.network, self.batchsize)
+        if len(self.mcts.nodes) > self.maxnodes:
+            self.mcts.clear()
+        return self.mcts.bestMove(game, self.iterations, self.temperature)
+
+
+if __name__ == "__main__":
+    from selfplay import playGames, summarise, greedyPlayer
+    t0 = time.time()
+    res = playGames(MCTSPlayer(iterations=100), greedyPlayer, 20, swapcolours=True)
+    print(f"MCTS against greedy: {summarise(res)} in {round(time.time() - t0, 2)} seconds")
@@ -0,0 +1,92 @@
+# Optional counters and timers for profiling the move generator, evaluation, alpha-beta search and MCTS
+# Recording is off by default, instrumented code checks METRICS.enabled before doing anything else
+# so it can be left in place and switched on in a running program with METRICS.enable()
+import json
+import time
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+class _Timer:
+    def __init__(self, metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+        self.t0 = 0.0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.metrics.addTime(self.name, time.perf_counter() - self.t0)
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.counters = {}
+        # Total seconds spent in each phase
+        self.timers = {}
+        self.started = time.perf_counter()
+
+    def enable(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+
+    def reset(self) -> None:
+        self.counters = {}
+        self.timers = {}
+        self.started = time.perf_counter()
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def addTime(self, name: str, seconds: float) -> None:
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    # Context manager timing a phase, does nothing while disabled
+    def timer(self, name: str):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    # Counters and timers with rates worked out from them
+    def snapshot(self) -> dict:
+        c = self.counters
+        t = self.timers
+        rates = {}
+        if t.get("search"):
+            rates["search_nodes_per_sec"] = c.get("search_nodes", 0) / t["search"]
+        if c.get("tt_probes"):
+            rates["tt_hit_rate"] = c.get("tt_hits", 0) / c["tt_probes"]
+        if c.get("legal_turns_calls"):
+            rates["turns_per_movegen"] = c.get("legal_turns", 0) / c["legal_turns_calls"]
+        if c.get("legal_moves_calls"):
+            rates["moves_per_legal_moves"] = c.get("legal_moves", 0) / c["legal_moves_calls"]
+        if c.get("nn_cache_hits", 0) + c.get("nn_cache_misses", 0):
+            rates["nn_cache_hit_rate"] = c["nn_cache_hits"] / (c["nn_cache_hits"] + c["nn_cache_misses"])
+        if t.get("nn"):
+            rates["nn_positions_per_sec"] = c.get("nn_positions", 0) / t["nn"]
+        if t.get("mcts"):
+            rates["mcts_iterations_per_sec"] = c.get("mcts_iterations", 0) / t["mcts"]
+        return {"elapsed": time.perf_counter() - self.started, "counters": dict(c), "timers": dict(t),
+                "rates": rates}
+
+    # Appends the snapshot to a JSON lines file, extra keyword arguments are added to the record
+    def write(self, path: str, **extra) -> dict:
+        record = {"time": time.time(), **extra, **self.snapshot()}
+        with open(path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        return record
+
+
+# Shared by every module so one switch turns all the instrumentation on
+METRICS = Metrics()
@@ -1,11 +1,13 @@
 # Noughts and Crosses Game for testing alpha-zero type algorithm
 import time
-import math
+import random
+from collections import OrderedDict
 import numpy as np
 import tensorflow as tf
 from tensorflow import keras
 from keras import layers, Input
 from keras.models import load_model
+from metrics import METRICS
 
 
 def decodeBoard(encode: int, listformat=False):
@@ -23,36 +25,131 @@ def decodeBoard(encode: int, listformat=False):
     return newboard
 
 
-class Node:
-    def __init__(self, priorprob: float, val: float):
-        self.wins = 0
-        self.draws = 0
-        self.visits = 0
+# The eight rotations and reflections of the board, each as the square every square is moved to
+def _symmetries() -> list:
+    symmetries = []
+    for n in range(8):
+        moved = []
+        for sq in range(9):
+            r, c = sq // 3, sq % 3
+            for _ in range(n % 4):
+                r, c = c, 2 - r
+            if n >= 4:
+                c = 2 - c
+            moved.append(3 * r + c)
+        symmetries.append(moved)
+    return symmetries
+
+
+SYMMETRIES = _symmetries()
+# The square each square is moved back to
+INVERSE_SYMMETRIES = [[sym.index(sq) for sq in range(9)] for sym in SYMMETRIES]
+
+
+def transformBoard(board: list, sym: int) -> list:
+    newboard = [0] * 9
+    for sq, moved in enumerate(SYMMETRIES[sym]):
+        newboard[moved] = board[sq // 3][sq % 3]
+    return [newboard[0:3], newboard[3:6], newboard[6:9]]
+
+
+# Tables for all 3^9 board keys (NAC.encodeBoard) so the tree search can work on keys without building boards
+# As in TrainNetwork the board is from the side of the player about to move, whose pieces are 1
+def _stateTables() -> tuple:
+    keys = np.arange(3 ** 9)
+    powers = 3 ** np.arange(9)
+    digits = keys[:, None] // powers % 3
+    squares = np.where(digits == 2, -1, digits)
+    lines = [[0, 1, 2], [3, 4, 5], [6, 7, 8], [0, 3, 6], [1, 4, 7], [2, 5, 8], [0, 4, 8], [2, 4, 6]]
+    sums = squares[:, lines].sum(axis=2)
+    won = (sums == 3).any(axis=1)
+    lost = (sums == -3).any(axis=1)
+    empty = digits == 0
+    full = ~empty.any(axis=1)
+    # The same as NAC.reward, nan if the game isn't over
+    rewards = np.full(len(keys), np.nan)
+    rewards[full] = 0.5
+    rewards[lost] = 0
+    rewards[won] = 1
+    terminal = won | lost | full
+    legal = (empty * (1 << np.arange(9))).sum(axis=1).astype(np.uint16)
+    # Key after playing on each square, -1 if the square is taken
+    children = np.where(empty, keys[:, None] + powers, -1).astype(np.int32)
+    flipped = ((3 - digits) % 3 * powers).sum(axis=1).astype(np.int32)
+    symkeys = np.stack([(digits * 3 ** np.array(sym)).sum(axis=1) for sym in SYMMETRIES], axis=1)
+    canonical = symkeys.min(axis=1).astype(np.int32)
+    canonicalsyms = symkeys.argmin(axis=1).astype(np.int8)
+    boards = squares.reshape(-1, 3, 3).astype(np.int8)
+    return boards, rewards, terminal, legal, children, flipped, canonical, canonicalsyms
+
+
+BOARDS, REWARDS, TERMINAL, LEGAL_MASKS, CHILD_KEYS, FLIPPED_KEYS, CANONICAL_KEYS, CANONICAL_SYMS = _stateTables()
+# Squares in each legal move mask
+MASK_MOVES = [[sq for sq in range(9) if mask >> sq & 1] for mask in range(512)]
+
+
+# Statistics for the nodes of the search tree in NumPy arrays, one row per node
+# Nodes are looked up by board key through index and the arrays grow by chunk rows whenever they are full
+class NodeStore:
+    def __init__(self, chunk: int = 4096):
+        self.chunk = chunk
+        self.index = {}
+        self.size = 0
+        self.capacity = 0
+        self.keys = np.zeros(0, dtype=np.int32)
+        self.visits = np.zeros(0, dtype=np.int64)
+        self.wins = np.zeros(0, dtype=np.int64)
+        self.draws = np.zeros(0, dtype=np.int64)
         # Estimated probability of winning from this position
-        self.priorprob = priorprob
-        self.expanded = False
+        self.prior = np.zeros(0)
         # Estimation for the value of the rest of the decision tree
-        self.val = val
-        # Stores data about child nodes for creating the training data quicker
-        self.childkeys = {}
-
-    def searchScore(self, parent):
-        u = self.priorprob
-        m = parent.visits
-        n = self.visits
-        return u + math.sqrt(m) / (n + 1)
-
-    def score(self):
-        if self.visits == 0:
-            return self.val
-        else:
-            return (self.wins + 0.5 * self.draws) / self.visits
+        self.val = np.zeros(0)
+        self.expanded = np.zeros(0, dtype=bool)
+        # Row of the child node after playing on each square, -1 if there isn't one
+        self.children = np.zeros((0, 9), dtype=np.int32)
+        self.grow()
 
-    def value(self):
-        if self.visits == 0:
-            return self.priorprob
-        else:
-            return self.wins / self.visits
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.index
+
+    def grow(self) -> None:
+        self.capacity += self.chunk
+        for name in ("keys", "visits", "wins", "draws", "prior", "val", "expanded"):
+            old = getattr(self, name)
+            new = np.zeros(self.capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+        children = np.full((self.capacity, 9), -1, dtype=np.int32)
+        children[:self.size] = self.children[:self.size]
+        self.children = children
+
+    # Adds a node and returns its row
+    def add(self, key: int, priorprob: float, val: float) -> int:
+        if self.size == self.capacity:
+            self.grow()
+        row = self.size
+        self.size += 1
+        self.index[key] = row
+        self.keys[row] = key
+        self.prior[row] = priorprob
+        self.val[row] = val
+        return row
+
+    # Scores of several children of one parent at once
+    def searchScores(self, parent: int, rows):
+        return self.prior[rows] + np.sqrt(self.visits[parent]) / (self.visits[rows] + 1)
+
+    def scores(self, rows):
+        visits = self.visits[rows]
+        scores = (self.wins[rows] + 0.5 * self.draws[rows]) / np.maximum(visits, 1)
+        return np.where(visits == 0, self.val[rows], scores)
+
+    def values(self, rows):
+        visits = self.visits[rows]
+        return np.where(visits == 0, self.prior[rows], self.wins[rows] / np.maximum(visits, 1))
 
 
 class NAC:
@@ -140,6 +237,12 @@ class NAC:
                 e += 3 ** n * col * (3 * col - 1) / 2
         return int(e)
 
+    # Smallest key of the eight symmetric boards and the symmetry that gives it
+    # A move on the board is the move SYMMETRIES[sym][move] on the board with the smallest key
+    def canonicalKey(self, board=None) -> tuple:
+        key = self.encodeBoard(board)
+        return int(CANONICAL_KEYS[key]), int(CANONICAL_SYMS[key])
+
     def flipBoard(self, board=None):
         if board is None:
             board = self.board
@@ -195,45 +298,157 @@ class NAC:
             return move_hist
 
 
+# Network outputs by board key (NAC.encodeBoard), the least recently used entry is dropped once it is full
+# Entries are stored with the model and the number of training steps it has taken so they aren't used once
+# the weights have been trained, call clear after changing the weights any other way
+class EvalCache:
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def modelVersion(policy) -> tuple:
+        optimizer = getattr(policy, "optimizer", None)
+        steps = int(np.asarray(optimizer.iterations)) if optimizer is not None else 0
+        return id(policy), steps
+
+    def get(self, version: tuple, key: int):
+        evals = self.entries.get((version, key))
+        if evals is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end((version, key))
+        return evals
+
+    def put(self, version: tuple, key: int, evals) -> None:
+        self.entries[(version, key)] = evals
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries = OrderedDict()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries),
+                "hitrate": self.hits / lookups if lookups else 0}
+
+
 class TrainNetwork:
-    def __init__(self, policy):
+    def __init__(self, policy, cachesize: int = 100000, symmetry: bool = True):
         self.nac = NAC()
-        self.nodes = {}
+        self.nodes = NodeStore()
         self.policy = policy
+        # Positions are only sent to the network once while the weights stay the same, 0 turns the cache off
+        self.cache = EvalCache(cachesize)
+        # Symmetric positions share one node and one evaluation, each node is stored as its canonical board so
+        # the moves in its child table are on that board
+        self.symmetry = symmetry
+
+    def nodeKey(self, key: int) -> int:
+        if self.symmetry:
+            return int(CANONICAL_KEYS[key])
+        return key
+
+    # Move on the board to the same move on the board the node is stored as
+    def nodeMove(self, key: int, move: int) -> int:
+        if self.symmetry:
+            return SYMMETRIES[CANONICAL_SYMS[key]][move]
+        return move
+
+    def predict(self, policy, boards: list):
+        return self.predictKeys(policy, [self.nac.encodeBoard(b) for b in boards])
+
+    # Every network call goes through here so repeated boards come from the cache
+    # With symmetry the canonical board is evaluated and the move outputs are put back on the board given
+    def predictKeys(self, policy, keys: list):
+        syms = None
+        if self.symmetry:
+            syms = CANONICAL_SYMS[keys]
+            keys = CANONICAL_KEYS[keys].tolist()
+        if self.cache.maxsize == 0:
+            evals = list(self.callModel(policy, BOARDS[keys]))
+        else:
+            version = self.cache.modelVersion(policy)
+            evals = [self.cache.get(version, k) for k in keys]
+            missing = [i for i, e in enumerate(evals) if e is None]
+            if METRICS.enabled:
+                METRICS.count("nn_cache_hits", len(keys) - len(missing))
+                METRICS.count("nn_cache_misses", len(missing))
+            if missing:
+                newevals = self.callModel(policy, BOARDS[[keys[i] for i in missing]])
+                for i, e in zip(missing, newevals):
+                    evals[i] = e
+                    self.cache.put(version, keys[i], e)
+        if syms is not None:
+            evals = [np.concatenate([e[SYMMETRIES[sym]], e[9:]]) if sym else e for e, sym in zip(evals, syms)]
+        return np.array(evals)
+
+    # The model is called directly on the whole batch as predict has a large fixed cost for every call
+    def callModel(self, policy, boards):
+        x = np.array(boards, dtype=np.float32)
+        if not METRICS.enabled:
+            return np.asarray(policy(x, training=False))
+        with METRICS.timer("nn"):
+            evals = np.asarray(policy(x, training=False))
+        METRICS.count("nn_calls")
+        METRICS.count("nn_positions", len(boards))
+        return evals
 
     def updateValue(self, nodekey: int):
-        parent = self.nodes[nodekey]
-        if parent.expanded:
-            parent.val = 1 - np.max([self.nodes[parent.childkeys[l]].val for l in parent.childkeys])
+        nodes = self.nodes
+        row = nodes.index[nodekey]
+        if nodes.expanded[row]:
+            children = nodes.children[row]
+            nodes.val[row] = 1 - nodes.val[children[children >= 0]].max()
 
     def expandNode(self, nodekey: int, policy=None):
         if policy is None:
             policy = self.policy
-        parent = self.nodes[nodekey]
-        parentboard = decodeBoard(nodekey)
-        if self.nac.reward(parentboard) is None:
-            evals = policy.predict([parentboard])[0]
-            lmoves = self.nac.getLegalMoves(parentboard)
+        nodes = self.nodes
+        row = nodes.index[nodekey]
+        if not TERMINAL[nodekey]:
+            lmoves = MASK_MOVES[LEGAL_MASKS[nodekey]]
+            children = {}
+            newkeys = []
+            for l in lmoves:
+                # Key after the move and the key of the child node for the other player
+                movedkey = int(CHILD_KEYS[nodekey, l])
+                flippedkey = int(FLIPPED_KEYS[movedkey])
+                newkey = self.nodeKey(flippedkey)
+                children[l] = (movedkey, newkey)
+                if newkey not in self.nodes and not TERMINAL[movedkey] and newkey not in newkeys:
+                    newkeys.append(newkey)
+            # The parent and all the new children are evaluated in one call
+            evals = self.predictKeys(policy, [nodekey] + newkeys)
             for l in lmoves:
-                newboard = self.nac.move(l, 1, parentboard, True)
-                flippednewboard = self.nac.flipBoard(newboard)
-                newkey = self.nac.encodeBoard(flippednewboard)
-                newevals = policy.predict([flippednewboard])[0]
-                self.nodes[nodekey].childkeys[l] = newkey
-                if newkey not in self.nodes:
-                    if self.nac.reward(newboard) is None:
-                        self.nodes[newkey] = Node(evals[l], newevals[-1])
+                movedkey, newkey = children[l]
+                if newkey not in nodes:
+                    if TERMINAL[movedkey]:
+                        nodes.add(newkey, evals[0][l], float(REWARDS[movedkey]))
                     else:
-                        self.nodes[newkey] = Node(evals[l], self.nac.reward(newboard))
+                        nodes.add(newkey, evals[0][l], evals[1 + newkeys.index(newkey)][-1])
+                nodes.children[row, l] = nodes.index[newkey]
             if len(lmoves) > 0:
-                parent.expanded = True
+                nodes.expanded[row] = True
+            if METRICS.enabled:
+                METRICS.count("nac_expansions")
+                METRICS.count("nac_legal_moves", len(lmoves))
 
     def getNewNode(self, nodekey: int, policy=None):
         if policy is None:
             policy = self.policy
-        parent = self.nodes[nodekey]
-        parentboard = decodeBoard(nodekey)
-        lmoves = self.nac.getLegalMoves(parentboard)
+        nodes = self.nodes
+        lmoves = MASK_MOVES[LEGAL_MASKS[nodekey]]
+        # The statistics of all the children are read from the store at once
+        rows = nodes.children[nodes.index[nodekey], lmoves]
+        childkeys = nodes.keys[rows].tolist()
+        priorprobs = nodes.prior[rows].tolist()
+        childvisits = nodes.visits[rows].tolist()
+        expanded = nodes.expanded[rows].tolist()
         globalmaxeval = 0
         globalmaxmove = 0
         globalmaxvisits = 0
@@ -241,86 +456,95 @@ class TrainNetwork:
         maxeval = -1
         maxmove = -1
         maxkey = -1
-        for l in lmoves:
-            childkey = parent.childkeys[l]
-            child = self.nodes[childkey]
-            if child.priorprob > globalmaxeval:
-                globalmaxeval = child.priorprob
+        for i, l in enumerate(lmoves):
+            priorprob = priorprobs[i]
+            visits = childvisits[i]
+            if priorprob > globalmaxeval:
+                globalmaxeval = priorprob
                 globalmaxmove = l
-                globalmaxvisits = child.visits
-                globalmaxkey = childkey
-            if not child.expanded and child.priorprob > maxeval and child.visits < globalmaxvisits:
-                maxeval = child.priorprob
+                globalmaxvisits = visits
+                globalmaxkey = childkeys[i]
+            if not expanded[i] and priorprob > maxeval and visits < globalmaxvisits:
+                maxeval = priorprob
                 maxmove = l
-                maxkey = childkey
+                maxkey = childkeys[i]
         # If all the nodes have been expanded pick the highest scoring node which has been visited the least
         if maxmove == -1:
             maxvisits = globalmaxvisits
-            for l in lmoves:
-                childkey = parent.childkeys[l]
-                child = self.nodes[childkey]
-                if child.visits < globalmaxvisits and child.visits <= maxvisits and child.priorprob > maxeval:
-                    maxeval = child.priorprob
+            for i, l in enumerate(lmoves):
+                priorprob = priorprobs[i]
+                visits = childvisits[i]
+                if visits < globalmaxvisits and visits <= maxvisits and priorprob > maxeval:
+                    maxeval = priorprob
                     maxmove = l
-                    maxkey = childkey
-                    maxvisits = child.visits
+                    maxkey = childkeys[i]
+                    maxvisits = visits
         # If all the nodes have been expanded the same amount pick the highest scoring node
         if maxmove == -1:
             maxmove = globalmaxmove
             maxkey = globalmaxkey
         return maxmove, maxkey
 
+    # The game is played on board keys, always from the side of the player about to move
     def simGame(self, policy=None):
         if policy is None:
             policy = self.policy
-        self.nac.resetBoard()
+        nodes = self.nodes
+        key = 0
         turn_counter = 0
         playing = True
-        # Stores game data
-        movekeys = []
+        # Stores game data as node rows
+        moverows = []
         while playing:
-            evals = policy.predict([self.nac.board])[0]
-            boardcopy = self.nac.board.copy()
-            bckey = self.nac.encodeBoard(boardcopy)
-            movekeys.append(bckey)
-            if bckey not in self.nodes:
-                self.nodes[bckey] = Node(0, evals[-1])
-            lmoves = self.nac.getLegalMoves()
-            maxmove = 0
-            maxeval = 0
+            bckey = self.nodeKey(key)
+            lmoves = MASK_MOVES[LEGAL_MASKS[key]]
             gkeys = []
+            newkeys = []
             for l in lmoves:
-                e = evals[l]
-                unflippedboard = self.nac.move(l, 1, boardcopy, True)
-                flippedboard = self.nac.flipBoard(unflippedboard)
-                gkey = self.nac.encodeBoard(flippedboard)
+                flippedkey = int(FLIPPED_KEYS[CHILD_KEYS[key, l]])
+                gkey = self.nodeKey(flippedkey)
                 gkeys.append(gkey)
-                if gkey not in self.nodes:
-                    fboardval = policy.predict([flippedboard])[0][-1]
-                    self.nodes[gkey] = Node(e, fboardval)
-                if l not in self.nodes[bckey].childkeys:
-                    self.nodes[bckey].childkeys[l] = gkey
-                if self.nodes[gkey].searchScore(self.nodes[bckey]) > maxeval:
-                    maxmove = l
-                    maxeval = self.nodes[gkey].searchScore(self.nodes[bckey])
+                if gkey not in self.nodes and gkey not in newkeys:
+                    newkeys.append(gkey)
+            # The board and all the unseen children are evaluated in one call
+            allevals = self.predictKeys(policy, [key] + newkeys)
+            evals = allevals[0]
+            if bckey not in nodes:
+                nodes.add(bckey, 0, evals[-1])
+            brow = nodes.index[bckey]
+            moverows.append(brow)
+            grows = []
+            for l, gkey in zip(lmoves, gkeys):
+                if gkey not in nodes:
+                    nodes.add(gkey, evals[l], allevals[1 + newkeys.index(gkey)][-1])
+                grow = nodes.index[gkey]
+                grows.append(grow)
+                nodemove = self.nodeMove(key, l)
+                if nodes.children[brow, nodemove] == -1:
+                    nodes.children[brow, nodemove] = grow
+            # All the children are scored at once, the first highest score above 0 is played
+            scores = nodes.searchScores(brow, grows)
+            best = int(np.argmax(scores))
+            maxmove = lmoves[best] if scores[best] > 0 else 0
 
-            self.nodes[bckey].expanded = True
-            self.nac.move(maxmove, self.nac.player1)
+            nodes.expanded[brow] = True
+            key = int(CHILD_KEYS[key, maxmove])
             if turn_counter >= 4:
-                iswon = self.nac.checkWin(self.nac.player1)
+                iswon = REWARDS[key] == 1
                 if iswon:
-                    for i, mk in enumerate(movekeys):
-                        self.nodes[mk].visits += 1
-                        if i % 2 == turn_counter % 2:
-                            self.nodes[mk].wins += 1
+                    # Each position in a game is new so the rows are all different
+                    nodes.visits[moverows] += 1
+                    nodes.wins[moverows[turn_counter % 2::2]] += 1
                     playing = False
                 elif turn_counter == 8:
-                    for i, mk in enumerate(movekeys):
-                        self.nodes[mk].draws += 1
-                        self.nodes[mk].visits += 1
+                    nodes.draws[moverows] += 1
+                    nodes.visits[moverows] += 1
                     playing = False
             turn_counter += 1
-            self.nac.board = self.nac.flipBoard()
+            key = int(FLIPPED_KEYS[key])
+        if METRICS.enabled:
+            METRICS.count("selfplay_games")
+            METRICS.count("selfplay_moves", len(moverows))
 
     def playGames(self, games: int, policy=None):
         if policy is None:
@@ -333,51 +557,41 @@ class TrainNetwork:
                 print(f"Finished training on {g + 1} games. {round(dt, 3)} seconds")
                 t0 = time.time()
 
+    # augment adds all eight symmetries of every board to the training data
     def trainModel(self, generations: int, games: int, policy=None, batchsize: int = 32,
-                   epochs: int = 5, startgen: int = 0):
+                   epochs: int = 5, startgen: int = 0, augment: bool = False):
         if policy is None:
             policy = self.policy
         for gen in range(generations):
             # Reset training environment
-            self.nodes = {}
+            self.nodes = NodeStore()
             # Get all the raw training data
             t0 = time.time()
             self.playGames(games, policy)
             dt1 = round(time.time() - t0)
             print(f"Took {dt1 // 60}:{dt1 % 60} to play {games} games.")
             print(f"Average time per game: {round(dt1 / games, 2)} seconds.")
-            x_train = []
-            y_train = []
             t1 = time.time()
-            for nodekey in self.nodes:
-                m_train = []
-                board = decodeBoard(nodekey)
-                x_train.append(board)
-                node = self.nodes[nodekey]
-                # Getting the probability of a win from move
-                if self.nac.reward(board) is None:
-                    if node.expanded:
-                        for l in range(9):
-                            if l in node.childkeys:
-                                childkey = node.childkeys[l]
-                                m_train.append(self.nodes[childkey].value())
-                            else:
-                                m_train.append(0)
-                    else:
-                        for _ in range(9):
-                            m_train.append(node.priorprob)
-                    # Add the board evaluation
-                    m_train.append(node.score())
-                else:
-                    r = self.nac.reward(board)
-                    if r == 1:
-                        for _ in range(9):
-                            m_train.append(1)
-                    else:
-                        for _ in range(9):
-                            m_train.append(0)
-                    m_train.append(r)
-                y_train.append(m_train)
+            nodes = self.nodes
+            rows = np.arange(len(nodes))
+            keys = nodes.keys[rows]
+            children = nodes.children[rows]
+            x_train = BOARDS[keys].tolist()
+            y_train = np.zeros((len(rows), 10))
+            # Getting the probability of a win from each move
+            values = nodes.values(rows)
+            y_train[:, :9] = np.where(children >= 0, values[children], 0)
+            unexpanded = ~nodes.expanded[rows]
+            y_train[unexpanded, :9] = nodes.prior[rows][unexpanded, None]
+            # Add the board evaluation
+            y_train[:, 9] = nodes.scores(rows)
+            terminal = TERMINAL[keys]
+            rewards = REWARDS[keys][terminal]
+            y_train[terminal, :9] = (rewards == 1)[:, None]
+            y_train[terminal, 9] = rewards
+            y_train = y_train.tolist()
+            if augment:
+                x_train, y_train = augmentData(x_train, y_train)
             # Train the policy network
             dt = time.time() - t1
             print(f"Took {round(dt, 3)} seconds to generate training data.")
@@ -388,45 +602,58 @@ class TrainNetwork:
     def run(self, iterations: int, board: list, policy=None, movevalues: bool = False):
         if policy is None:
             policy = self.policy
-        self.nodes = {}
+        self.nodes = nodes = NodeStore()
+        t0 = time.perf_counter()
         # Create the root node
-        root_evals = policy.predict([board])[0]
-        rootkey = self.nac.encodeBoard(board)
-        self.nodes[rootkey] = Node(1, root_evals[-1])
-        root = self.nodes[rootkey]
+        boardkey = self.nac.encodeBoard(board)
+        root_evals = self.predictKeys(policy, [boardkey])[0]
+        rootkey = self.nodeKey(boardkey)
+        root = nodes.add(rootkey, 1, root_evals[-1])
         # Expand the root node
         self.expandNode(rootkey, policy)
         for _ in range(iterations):
-            current_node = root
+            current_row = root
             search_path = [rootkey]
             # Go down the tree until a new node is expanded
-            while current_node.expanded:
+            while nodes.expanded[current_row]:
                 newmove, newnodekey = self.getNewNode(search_path[-1], policy)
                 search_path.append(newnodekey)
-                current_node = self.nodes[newnodekey]
+                current_row = nodes.index[newnodekey]
             # Expand the new node
             self.expandNode(search_path[-1], policy)
             # Propagate the values back up the tree
             for i in range(len(search_path) - 1, -1, -1):
                 nodekey = search_path[i]
-                nodeboard = decodeBoard(nodekey)
-                if self.nac.reward(nodeboard) is None:
+                row = nodes.index[nodekey]
+                if not TERMINAL[nodekey]:
                     self.updateValue(nodekey)
                 else:
-                    self.nodes[nodekey].val = 1 - self.nac.reward(nodeboard)
-                self.nodes[nodekey].visits += 1
+                    nodes.val[row] = 1 - float(REWARDS[nodekey])
+                nodes.visits[row] += 1
+        if METRICS.enabled:
+            METRICS.count("mcts_searches")
+            METRICS.count("mcts_iterations", iterations)
+            # The tree is started again for every run so all of it was added by this search
+            METRICS.count("mcts_nodes", len(self.nodes))
+            METRICS.addTime("mcts", time.perf_counter() - t0)
         # Pick the best move from the expansions
         maxval = 0
         if movevalues:
             allvals = {}
         maxmove = 0
-        for l in root.childkeys:
-            childkey = root.childkeys[l]
+        # Moves in the tree are on the canonical board, they are put back on the board given
+        sym = CANONICAL_SYMS[boardkey] if self.symmetry else 0
+        for l in range(9):
+            child = nodes.children[root, l]
+            if child < 0:
+                continue
+            move = INVERSE_SYMMETRIES[sym][l]
+            val = float(nodes.val[child])
             if movevalues:
-                allvals[l] = round(self.nodes[childkey].val, 3)
-            if self.nodes[childkey].val > maxval:
-                maxmove = l
-                maxval = self.nodes[childkey].val
+                allvals[move] = round(val, 3)
+            if val > maxval:
+                maxmove = move
+                maxval = val
         if movevalues:
             return maxmove, allvals
         return maxmove
@@ -442,7 +669,7 @@ class TrainNetwork:
         tc = 0
         while playing:
             flippedboard = self.nac.flipBoard()
-            evals = policies[tc % 2].predict([self.nac.board])[0]
+            evals = self.predict(policies[tc % 2], [self.nac.board])[0]
             print("Board Evaluation =", round(2 * evals[-1] - 1, 2))
             if tc % 2 == 0:
                 self.nac.printBoard()
@@ -469,6 +696,67 @@ class TrainNetwork:
             tc += 1
 
 
+# Every symmetry of each board with the move targets moved in the same way, the last target is the value
+def augmentData(x_train: list, y_train: list) -> tuple:
+    x_aug = []
+    y_aug = []
+    for board, targets in zip(x_train, y_train):
+        for sym in range(8):
+            x_aug.append(transformBoard(board, sym))
+            moved = [0] * 9
+            for sq in range(9):
+                moved[SYMMETRIES[sym][sq]] = targets[sq]
+            y_aug.append(moved + list(targets[9:]))
+    return x_aug, y_aug
+
+
+# Agents for headless games, called with the game and the board from their side (their pieces are 1)
+def randomAgent(nac: NAC, board: list) -> int:
+    return random.choice(nac.getLegalMoves(board))
+
+
+class MCTSAgent:
+    def __init__(self, modelpath: str, iterations: int = 100):
+        self.modelpath = modelpath
+        self.iterations = iterations
+        # Loaded when first needed so the agent can be sent to other processes
+        self.tn = None
+
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        state["tn"] = None
+        return state
+
+    def __call__(self, nac: NAC, board: list) -> int:
+        if self.tn is None:
+            self.tn = TrainNetwork(load_model(self.modelpath))
+        return self.tn.run(self.iterations, board)
+
+
+# Plays a game with no input or output, an opening is a list of squares played before the agents take over
+# Returns 1 if the first player wins, -1 if the second player wins and 0 for a draw
+def playHeadless(player1, player2, opening: list = None, seed: int = None) -> int:
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+    nac = NAC()
+    players = [player1, player2]
+    tc = 0
+    moves = list(opening) if opening is not None else []
+    while True:
+        if len(nac.getLegalMoves()) == 0:
+            return 0
+        if tc < len(moves):
+            sq = moves[tc]
+        else:
+            sq = players[tc % 2](nac, nac.board)
+        nac.move(sq, 1)
+        if nac.checkWin(1):
+            return 1 if tc % 2 == 0 else -1
+        nac.board = nac.flipBoard()
+        tc += 1
+
+
 if __name__ == "__main__":
     policy = load_model("nacnn4.h5")
     tn = TrainNetwork(policy)
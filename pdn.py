@@ -0,0 +1,228 @@
+# Reading and writing draughts games in a PDN style text format
+# Squares are numbered 1 to 32 from PLAYER1's side so PLAYER1 starts on 1-12 and moves first like black in PDN
+# Moves are written "a-b" or with every landing square of a take "axbxc", a forfeited turn is "--"
+# and the evaluation after a move can follow it as a comment e.g. "9-14 {0.05}"
+import gzip
+import re
+from draughts import Draughts, PLAYER1, PLAYER2, SQUARES, SQUARE_XY, squareIndex, NEIGHBOUR, JUMP
+
+RESULTS = {PLAYER1: "1-0", PLAYER2: "0-1", 0: "1/2-1/2"}
+WINNERS = {"1-0": PLAYER1, "0-1": PLAYER2, "1/2-1/2": 0, "*": None}
+_TOKENS = re.compile(r"\{[^}]*\}|[^\s{]+")
+
+
+def squareNumber(s: int) -> int:
+    return SQUARES - s
+
+
+def numberSquare(n: int) -> int:
+    return SQUARES - n
+
+
+# A turn such as "52RU" in PDN notation, the game has to be in the position before the turn
+def turnToPDN(game: Draughts, turn: str) -> str:
+    if turn == "":
+        return "--"
+    sq = squareIndex(int(turn[0]), int(turn[1]))
+    occupied = game.men[PLAYER1] | game.kings[PLAYER1] | game.men[PLAYER2] | game.kings[PLAYER2]
+    squares = [squareNumber(sq)]
+    take = False
+    for i in range(2, len(turn), 2):
+        d = turn[i:i + 2]
+        if occupied >> NEIGHBOUR[d][sq] & 1:
+            take = True
+            sq = JUMP[d][sq]
+        else:
+            sq = NEIGHBOUR[d][sq]
+        squares.append(squareNumber(sq))
+    return ("x" if take else "-").join(str(n) for n in squares)
+
+
+# Doesn't need the position since every square the piece lands on is written down
+def pdnToTurn(move: str) -> str:
+    if move == "--":
+        return ""
+    squares = [numberSquare(int(n)) for n in re.split("[-x]", move)]
+    x, y = SQUARE_XY[squares[0]]
+    turn = f"{x}{y}"
+    for a, b in zip(squares, squares[1:]):
+        xa, ya = SQUARE_XY[a]
+        xb, yb = SQUARE_XY[b]
+        turn += ("L" if xb < xa else "R") + ("U" if yb < ya else "D")
+    return turn
+
+
+# FEN tag "B:W21,22,K30:B1,2,3" with B for PLAYER1 and W for PLAYER2, the first letter is the player to move
+def positionToFEN(game: Draughts) -> str:
+    parts = ["B" if game.turn == PLAYER1 else "W"]
+    for colour, player in (("W", PLAYER2), ("B", PLAYER1)):
+        squares = []
+        for s in range(SQUARES):
+            if game.men[player] >> s & 1:
+                squares.append((squareNumber(s), str(squareNumber(s))))
+            elif game.kings[player] >> s & 1:
+                squares.append((squareNumber(s), f"K{squareNumber(s)}"))
+        parts.append(colour + ",".join(n for _, n in sorted(squares)))
+    return ":".join(parts)
+
+
+def positionFromFEN(fen: str) -> Draughts:
+    game = Draughts()
+    men = {PLAYER1: 0, PLAYER2: 0}
+    kings = {PLAYER1: 0, PLAYER2: 0}
+    side, *colours = fen.strip().split(":")
+    for part in colours:
+        player = PLAYER1 if part[0] == "B" else PLAYER2
+        for n in part[1:].split(","):
+            if n == "":
+                continue
+            if n[0] == "K":
+                kings[player] |= 1 << numberSquare(int(n[1:]))
+            else:
+                men[player] |= 1 << numberSquare(int(n))
+    game.turn = PLAYER1 if side == "B" else PLAYER2
+    game.setBits(men, kings)
+    return game
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t")
+    return open(path, mode)
+
+
+# Appends games one at a time so a self-play worker can write as it goes, paths ending in .gz are compressed
+class GameWriter:
+    def __init__(self, path: str, append: bool = True):
+        self.file = _open(path, "a" if append else "w")
+        self.games = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.file.close()
+
+    # moves are turns as returned by Draughts.legalTurns
+    # winner is PLAYER1, PLAYER2, 0 for a draw or None if unfinished
+    def writeGame(self, moves: list, winner=None, evals: list = None, tags: dict = None,
+                  start: Draughts = None) -> None:
+        # The moves are played on a copy so the caller's start position is left alone
+        game = Draughts()
+        if start is not None:
+            game = Draughts(start.geometry.size)
+            game.setState(start.getState())
+        result = RESULTS.get(winner, "*")
+        headers = dict(tags or {})
+        headers["Result"] = result
+        if start is not None:
+            headers["FEN"] = positionToFEN(game)
+        lines = [f'[{k} "{v}"]' for k, v in headers.items()]
+        tokens = []
+        for i, turn in enumerate(moves):
+            if i % 2 == 0:
+                tokens.append(f"{i // 2 + 1}.")
+            tokens.append(turnToPDN(game, turn))
+            if turn == "":
+                game.turn = PLAYER1 + PLAYER2 - game.turn
+            else:
+                game.makeMove(turn)
+            if evals is not None and i < len(evals):
+                tokens.append(f"{{{evals[i]}}}")
+        tokens.append(result)
+        # Keep lines a sensible length
+        line = ""
+        for t in tokens:
+            if len(line) + len(t) + 1 > 80:
+                lines.append(line)
+                line = t
+            else:
+                line = f"{line} {t}" if line else t
+        lines.append(line)
+        self.file.write("\n".join(lines) + "\n\n")
+        self.file.flush()
+        self.games += 1
+
+    # Writes a result from selfplay.playGame
+    def writeResult(self, result: dict, tags: dict = None) -> None:
+        tags = dict(tags or {})
+        tags.setdefault("Termination", result["reason"])
+        winner = None if result["reason"] == "turn limit" else result["winner"]
+        # Passes have no evaluation in selfplay so they are lined up with the moves here
+        evals = []
+        e = iter(result["evals"])
+        for m in result["moves"]:
+            evals.append(next(e) if m != "" else "")
+        self.writeGame(result["moves"], winner, evals, tags)
+
+
+def _parseGame(tags: dict, movetext: list) -> dict:
+    moves = []
+    evals = []
+    result = "*"
+    for token in _TOKENS.findall(" ".join(movetext)):
+        if token[0] == "{":
+            text = token[1:-1].strip()
+            # A comment before the first move has no move to go with
+            if not evals:
+                continue
+            try:
+                evals[-1] = float(text)
+            except ValueError:
+                pass
+        elif token in WINNERS:
+            result = token
+        elif token[-1] == "." and token[:-1].isdigit():
+            continue
+        else:
+            moves.append(pdnToTurn(token))
+            evals.append(None)
+    result = tags.get("Result", result)
+    game = {"tags": tags, "moves": moves, "winner": WINNERS.get(result), "result": result}
+    if any(e is not None for e in evals):
+        game["evals"] = evals
+    if "FEN" in tags:
+        game["start"] = positionFromFEN(tags["FEN"])
+    return game
+
+
+# Yields one game at a time so archives of any size can be read, paths ending in .gz are decompressed
+def readGames(path: str):
+    tags = {}
+    movetext = []
+    with _open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("["):
+                # A tag after some moves is the start of the next game
+                if movetext:
+                    yield _parseGame(tags, movetext)
+                    tags = {}
+                    movetext = []
+                match = re.match(r'\[(\w+)\s+"(.*)"\]', line)
+                if match:
+                    tags[match.group(1)] = match.group(2)
+            elif line:
+                movetext.append(line)
+            elif movetext:
+                yield _parseGame(tags, movetext)
+                tags = {}
+                movetext = []
+    if movetext or tags:
+        yield _parseGame(tags, movetext)
+
+
+# Plays a game record through from the start, checking every move is legal
+def replayGame(record: dict) -> Draughts:
+    game = record.get("start") or Draughts()
+    for turn in record["moves"]:
+        if turn == "":
+            game.turn = PLAYER1 + PLAYER2 - game.turn
+            continue
+        if turn not in game.legalTurns():
+            raise ValueError(f"Illegal move {turn} in game record")
+        game.makeMove(turn)
+    return game
@@ -0,0 +1,99 @@
+# Perft for draughts
+# Counts the positions reached after a number of full turns to check the move generator and measure its speed
+# A position with no legal turns counts as the end of that branch
+import sys
+import time
+from draughts import Draughts, PLAYER1, PLAYER2
+
+# (encoding from encodeBoard, player to move, number of positions after 1, 2, 3... turns)
+TEST_POSITIONS = [
+    # Start position, the same counts as English draughts
+    ("mmmmmmyyyyaaaaaa", PLAYER1, [7, 49, 302, 1469, 7361, 36768, 179740]),
+    # Middle game with kings on both sides
+    ("jyywywyyvyeaeeeu", PLAYER2, [2, 22, 48, 303, 600, 3366]),
+    # Branching multiple takes
+    ("owmmmywykuawuuua", PLAYER1, [1, 6, 46, 239, 1364, 6168]),
+    ("mommomoouaueaaau", PLAYER2, [1, 7, 35, 190, 848, 3569]),
+    # A piece promoted part way through a take carries on taking as a king
+    ("ywmyyeyoxyvyyuey", PLAYER1, [2, 8, 14, 70, 428, 2027, 11256]),
+]
+
+
+def perft(game: Draughts, depth: int) -> int:
+    if depth == 0:
+        return 1
+    turns = game.legalTurns()
+    # The last turn doesn't need to be played to be counted
+    if depth == 1:
+        return len(turns)
+    nodes = 0
+    for t in turns:
+        undo = game.makeMove(t)
+        nodes += perft(game, depth - 1)
+        game.unmakeMove(undo)
+    return nodes
+
+
+# Number of positions after each first turn, for finding where two move generators disagree
+def divide(game: Draughts, depth: int) -> dict:
+    counts = {}
+    for t in game.legalTurns():
+        undo = game.makeMove(t)
+        counts[t] = perft(game, depth - 1)
+        game.unmakeMove(undo)
+    return counts
+
+
+def loadPosition(encoding: str, player: int) -> Draughts:
+    game = Draughts()
+    game.board = game.decodeBoard(encoding)
+    game.turn = player
+    game.resetHistory()
+    return game
+
+
+# Checks every test position up to maxdepth, returns True if all the counts match
+def runSuite(maxdepth: int = None, verbose: bool = True) -> bool:
+    passed = True
+    totalnodes = 0
+    t0 = time.time()
+    for encoding, player, counts in TEST_POSITIONS:
+        game = loadPosition(encoding, player)
+        for depth, expected in enumerate(counts, 1):
+            if maxdepth is not None and depth > maxdepth:
+                break
+            t1 = time.time()
+            nodes = perft(game, depth)
+            dt = time.time() - t1
+            totalnodes += nodes
+            ok = nodes == expected
+            passed = passed and ok
+            if verbose or not ok:
+                nps = round(nodes / dt) if dt > 0 else 0
+                print(f"{encoding} Player {player} Depth {depth}: {nodes} (expected {expected}) "
+                      f"{'OK' if ok else 'FAIL'} {round(dt, 3)} seconds {nps} nodes/sec")
+    dt = time.time() - t0
+    if verbose:
+        print(f"{'Passed' if passed else 'Failed'}: {totalnodes} nodes in {round(dt, 3)} seconds, "
+              f"{round(totalnodes / dt) if dt > 0 else 0} nodes/sec")
+    return passed
+
+
+# Counts from the start position on a board of any size, there are no stored counts to check against
+def startPerft(size: int, maxdepth: int) -> None:
+    game = Draughts(size)
+    for depth in range(1, maxdepth + 1):
+        t0 = time.time()
+        nodes = perft(game, depth)
+        dt = time.time() - t0
+        print(f"{size}x{size} Depth {depth}: {nodes} {round(dt, 3)} seconds "
+              f"{round(nodes / dt) if dt > 0 else 0} nodes/sec")
+
+
+if __name__ == "__main__":
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    if size != 8:
+        startPerft(size, depth if depth is not None else 5)
+        sys.exit(0)
+    sys.exit(0 if runSuite(depth) else 1)
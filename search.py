@@ -0,0 +1,259 @@
+# Alpha-beta search for draughts
+# Negamax with iterative deepening, takes are forced so the search carries on past the depth limit while there
+# are takes
+import time
+from draughts import Draughts, PLAYER1, PLAYER2, DRAW_MOVES, moveMasks
+from metrics import METRICS
+
+# Scores are in sevenths of a piece from evalRaw (1 / (size - 1) on other board sizes)
+# Score for winning, the number of plies is taken off so quicker wins are preferred
+WIN = 10000
+# Transposition table bounds
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+
+# Fixed size table indexed by the low bits of the Zobrist hash
+# An entry is replaced if it is from an older search, for the same position or searched to the same depth or less
+class TranspositionTable:
+    def __init__(self, size: int = 1 << 18):
+        # Size is rounded down to a power of two so the index is a mask
+        self.size = 1 << (size.bit_length() - 1)
+        self.mask = self.size - 1
+        self.keys = [None] * self.size
+        # (depth, bound, score, best turn, generation)
+        self.entries = [None] * self.size
+        self.generation = 0
+        self.hits = 0
+        self.probes = 0
+
+    def clear(self) -> None:
+        self.keys = [None] * self.size
+        self.entries = [None] * self.size
+        self.generation = 0
+        self.hits = 0
+        self.probes = 0
+
+    def newSearch(self) -> None:
+        self.generation += 1
+
+    def probe(self, key: int):
+        self.probes += 1
+        i = key & self.mask
+        if self.keys[i] == key:
+            self.hits += 1
+            return self.entries[i]
+        return None
+
+    def store(self, key: int, depth: int, bound: int, score: float, turn: str) -> None:
+        i = key & self.mask
+        old = self.entries[i]
+        if old is None or self.keys[i] == key or old[4] != self.generation or depth >= old[0]:
+            # Keep the old best turn if the new search didn't find one
+            if turn is None and old is not None and self.keys[i] == key:
+                turn = old[3]
+            self.keys[i] = key
+            self.entries[i] = (depth, bound, score, turn, self.generation)
+
+
+class Search:
+    def __init__(self, game: Draughts = None, tt: TranspositionTable = None, tablebase=None):
+        if game is None:
+            game = Draughts()
+        if tt is None:
+            tt = TranspositionTable()
+        self.game = game
+        self.tt = tt
+        # Endgame tablebase from tablebase.py, positions with few enough pieces are looked up instead of searched
+        self.tablebase = tablebase
+        self.nodes = 0
+        # Two moves per ply which caused a cut-off in a sibling position
+        self.killers = {}
+        # How often a move has caused a cut-off weighted by depth
+        self.history = {}
+        self.pv = []
+        self.maxnodes = None
+        self.deadline = None
+        # The node and time limits are left out until the first iteration has finished
+        self.limited = False
+        self.stopped = False
+
+    def evaluate(self) -> int:
+        return self.game.evalRaw(self.game.turn)
+
+    # Can be called from another thread, the search unwinds and bestMove returns the last finished iteration
+    def stop(self) -> None:
+        self.stopped = True
+
+    def checkLimits(self) -> None:
+        if not self.limited:
+            return
+        if self.maxnodes is not None and self.nodes >= self.maxnodes:
+            self.stopped = True
+        elif self.deadline is not None and self.nodes % 256 == 0 and time.time() >= self.deadline:
+            self.stopped = True
+
+    def orderTurns(self, turns: list, ply: int, ttturn: str = None) -> list:
+        pvturn = self.pv[ply] if ply < len(self.pv) else None
+        killers = self.killers.get(ply, [])
+
+        # Longer turns take more pieces so they go first
+        def key(t):
+            if t == ttturn:
+                return 4, 0, 0
+            if t == pvturn:
+                return 3, 0, 0
+            return 2 if t in killers else 1, len(t), self.history.get(t, 0)
+
+        return sorted(turns, key=key, reverse=True)
+
+    def storeKiller(self, turn: str, ply: int, depth: int) -> None:
+        killers = self.killers.setdefault(ply, [])
+        if turn not in killers:
+            killers.insert(0, turn)
+            del killers[2:]
+        self.history[turn] = self.history.get(turn, 0) + depth * depth
+
+    def negamax(self, depth: int, alpha: float, beta: float, ply: int, passed: bool = False) -> tuple:
+        game = self.game
+        self.nodes += 1
+        self.checkLimits()
+        if self.stopped:
+            return 0, []
+        player = game.turn
+        opponent = PLAYER1 + PLAYER2 - player
+        if game.men[player] | game.kings[player] == 0:
+            return -WIN + ply, []
+        # A position that has been reached before is scored as a draw
+        if ply > 0 and (game.repetitions() > 1 or game.quiet >= 2 * DRAW_MOVES):
+            return 0, []
+        if self.tablebase is not None and ply > 0:
+            allpieces = game.men[PLAYER1] | game.kings[PLAYER1] | game.men[PLAYER2] | game.kings[PLAYER2]
+            if allpieces.bit_count() <= self.tablebase.maxpieces:
+                v = self.tablebase.probe(game)
+                if v is not None:
+                    if v > 0:
+                        return WIN - ply - v, []
+                    if v < 0:
+                        return -WIN + ply - v, []
+                    return 0, []
+        if depth <= 0:
+            take, _ = moveMasks(game.men, game.kings, player, geometry=game.geometry)
+            if not take:
+                return self.evaluate(), []
+        # Positions after a forfeited turn are left out of the table since a second forfeit is a draw
+        usett = depth > 0 and not passed
+        ttturn = None
+        if usett:
+            key = game.hashKey()
+            entry = self.tt.probe(key)
+            if entry is not None:
+                ttdepth, bound, score, ttturn, _ = entry
+                # The root is always searched so the full PV comes back and the repetitions on the way to it count,
+                # the stored move is only used for ordering there
+                if ttdepth >= depth and ply > 0:
+                    # Win scores are stored relative to the position
+                    if score > WIN / 2:
+                        score -= ply
+                    elif score < -WIN / 2:
+                        score += ply
+                    line = [ttturn] if ttturn else []
+                    if bound == EXACT:
+                        return score, line
+                    if bound == LOWER and score >= beta:
+                        return score, line
+                    if bound == UPPER and score <= alpha:
+                        return score, line
+            alpha0 = alpha
+        turns = game.legalTurns()
+        # No legal moves forfeits the turn, if both players are stuck it is a draw
+        if len(turns) == 0:
+            if passed:
+                return 0, []
+            game.turn = opponent
+            score, line = self.negamax(depth - 1, -beta, -alpha, ply + 1, True)
+            game.turn = player
+            return -score, [""] + line
+        bestscore = -WIN - 1
+        bestline = []
+        for t in self.orderTurns(turns, ply, ttturn):
+            undo = game.makeMove(t)
+            score, line = self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            score = -score
+            game.unmakeMove(undo)
+            if self.stopped:
+                return 0, []
+            if score > bestscore:
+                bestscore = score
+                bestline = [t] + line
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if depth > 0:
+                    self.storeKiller(t, ply, depth)
+                break
+        if usett:
+            if bestscore <= alpha0:
+                bound = UPPER
+            elif bestscore >= beta:
+                bound = LOWER
+            else:
+                bound = EXACT
+            score = bestscore
+            if score > WIN / 2:
+                score += ply
+            elif score < -WIN / 2:
+                score -= ply
+            self.tt.store(key, depth, bound, score, bestline[0] if bestline else None)
+        return bestscore, bestline
+
+    # Iterative deepening until the depth, node or time (seconds) limit is reached
+    # info is called with (depth, score, nodes, seconds, pv) after each finished iteration
+    def bestMove(self, maxdepth: int = 64, maxnodes: int = None, movetime: float = None,
+                 verbose: bool = False, info=None) -> tuple:
+        self.nodes = 0
+        self.killers = {}
+        self.history = {}
+        self.pv = []
+        self.maxnodes = maxnodes
+        self.deadline = None if movetime is None else time.time() + movetime
+        self.stopped = False
+        self.tt.newSearch()
+        t0 = time.time()
+        hits, probes = self.tt.hits, self.tt.probes
+        bestturn = None
+        bestscore = 0
+        for depth in range(1, maxdepth + 1):
+            # Depth 1 always finishes so a budgeted search still returns a searched move
+            self.limited = depth > 1
+            score, line = self.negamax(depth, -WIN - 1, WIN + 1, 0)
+            # Results from an unfinished iteration are thrown away
+            if self.stopped:
+                break
+            self.pv = line
+            bestscore = score
+            if line:
+                bestturn = line[0]
+            if info is not None:
+                info(depth, score, self.nodes, time.time() - t0, line)
+            if verbose:
+                dt = time.time() - t0
+                unit = self.game.geometry.unit
+                print(f"Depth {depth} Score {round(score / unit, 2)} Nodes {self.nodes} Time {round(dt, 3)} "
+                      f"TT hits {self.tt.hits}/{self.tt.probes} PV {' '.join(line)}")
+            # Stop early once a forced result has been found
+            if abs(score) > WIN / 2 or not line:
+                break
+        if METRICS.enabled:
+            METRICS.count("searches")
+            METRICS.count("search_nodes", self.nodes)
+            METRICS.count("tt_hits", self.tt.hits - hits)
+            METRICS.count("tt_probes", self.tt.probes - probes)
+            METRICS.addTime("search", time.time() - t0)
+        return bestturn, self.pv, bestscore
+
+
+if __name__ == "__main__":
+    s = Search()
+    s.bestMove(maxdepth=8, movetime=10, verbose=True)
@@ -0,0 +1,147 @@
+# Headless draughts games between two players, spread over a process pool
+# A player is called with the game and its legal turns and returns the turn to play
+import random
+import time
+from multiprocessing import Pool
+from draughts import Draughts, PLAYER1, PLAYER2, REPETITIONS
+from search import Search, TranspositionTable
+
+
+def randomPlayer(game: Draughts, turns: list) -> str:
+    return random.choice(turns)
+
+
+# Picks the turn with the best evaluation straight after it, ties are broken at random
+def greedyPlayer(game: Draughts, turns: list) -> str:
+    player = game.turn
+    best = []
+    bestscore = None
+    for t in turns:
+        undo = game.makeMove(t)
+        score = game.evalRaw(player)
+        game.unmakeMove(undo)
+        if bestscore is None or score > bestscore:
+            bestscore = score
+            best = [t]
+        elif score == bestscore:
+            best.append(t)
+    return random.choice(best)
+
+
+class SearchPlayer:
+    def __init__(self, maxdepth: int = 6, maxnodes: int = None, movetime: float = None, tablebase=None,
+                 book=None):
+        self.maxdepth = maxdepth
+        self.maxnodes = maxnodes
+        self.movetime = movetime
+        self.tablebase = tablebase
+        # Opening book from book.py, positions in the book are played without searching
+        self.book = book
+        # Made when first needed so the player is cheap to send to other processes
+        self.tt = None
+
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        state["tt"] = None
+        return state
+
+    def __call__(self, game: Draughts, turns: list) -> str:
+        if len(turns) == 1:
+            return turns[0]
+        if self.book is not None:
+            turn = self.book.probe(game, turns)
+            if turn is not None:
+                return turn
+        if self.tt is None:
+            self.tt = TranspositionTable()
+        search = Search(game, self.tt, self.tablebase)
+        turn, _, _ = search.bestMove(self.maxdepth, self.maxnodes, self.movetime)
+        if turn is None:
+            return random.choice(turns)
+        return turn
+
+
+# Plays one game with no input or output and returns the result
+# winner is PLAYER1, PLAYER2 or 0 for a draw, evals are evalBoard for PLAYER1 after each turn
+def playGame(player1, player2, seed: int = None, maxturns: int = 300, game: Draughts = None) -> dict:
+    if seed is not None:
+        random.seed(seed)
+    if game is None:
+        game = Draughts()
+    players = {PLAYER1: player1, PLAYER2: player2}
+    moves = []
+    evals = []
+    passes = 0
+    winner = 0
+    while True:
+        player = game.turn
+        if game.men[player] | game.kings[player] == 0:
+            winner = PLAYER1 + PLAYER2 - player
+            reason = "no pieces"
+            break
+        if game.isDraw():
+            reason = "repetition" if game.repetitions() >= REPETITIONS else "no progress"
+            break
+        if len(moves) >= maxturns:
+            reason = "turn limit"
+            break
+        turns = game.legalTurns()
+        # No legal moves forfeits the turn, if neither player can move it is a draw
+        if len(turns) == 0:
+            passes += 1
+            if passes == 2:
+                reason = "no legal moves"
+                break
+            moves.append("")
+            game.turn = PLAYER1 + PLAYER2 - player
+            continue
+        passes = 0
+        turn = players[player](game, turns)
+        game.makeMove(turn)
+        moves.append(turn)
+        evals.append(game.evalBoard(PLAYER1))
+    return {"winner": winner, "reason": reason, "length": len(moves), "moves": moves, "evals": evals, "seed": seed}
+
+
+def _playGame(args: tuple) -> dict:
+    player1, player2, seed, maxturns, swapped, size = args
+    if swapped:
+        result = playGame(player2, player1, seed, maxturns, Draughts(size))
+    else:
+        result = playGame(player1, player2, seed, maxturns, Draughts(size))
+    result["swapped"] = swapped
+    return result
+
+
+# Plays a number of games, with swapcolours every other game has player1 playing as PLAYER2
+# processes=1 plays in this process, None uses one process per CPU, size is the width of the board
+def playGames(player1, player2, games: int, processes: int = None, swapcolours: bool = False, seed: int = 0,
+              maxturns: int = 300, size: int = 8) -> list:
+    tasks = [(player1, player2, seed + g, maxturns, swapcolours and g % 2 == 1, size) for g in range(games)]
+    if processes == 1:
+        return [_playGame(t) for t in tasks]
+    with Pool(processes) as pool:
+        return pool.map(_playGame, tasks, chunksize=max(1, games // 64))
+
+
+# Wins, draws and losses for player1 taking swapped colours into account
+def summarise(results: list) -> dict:
+    summary = {"wins": 0, "draws": 0, "losses": 0, "games": len(results), "averagelength": 0}
+    for r in results:
+        winner = -r["winner"] if r.get("swapped") else r["winner"]
+        if winner == PLAYER1:
+            summary["wins"] += 1
+        elif winner == PLAYER2:
+            summary["losses"] += 1
+        else:
+            summary["draws"] += 1
+        summary["averagelength"] += r["length"] / max(1, len(results))
+    return summary
+
+
+if __name__ == "__main__":
+    t0 = time.time()
+    res = playGames(greedyPlayer, randomPlayer, 1000, swapcolours=True)
+    dt = time.time() - t0
+    print(f"Played {len(res)} games in {round(dt, 2)} seconds")
+    print(f"Greedy against random: {summarise(res)}")
@@ -0,0 +1,212 @@
+# Endgame tablebases for draughts
+# Every position with a few pieces is solved by working back from the finished games, the results go in one file
+# which is memory mapped so any number of processes can share it
+# Values are for the player to move: n > 0 wins in n plies, n < 0 loses in -n plies and 0 is a draw
+# Distances longer than 127 plies are stored as 127
+# The draw rules (threefold repetition, no takes or promotions) are not part of the tables
+import sys
+import time
+import itertools
+from array import array
+from math import comb
+import numpy as np
+from draughts import Draughts, PLAYER1, PLAYER2, SQUARES, PROMOTION_ROW
+
+MAGIC = b"DRTB"
+# The tables index the 32 squares of the 8x8 board
+BOARD_SIZE = 8
+HEADER = 8
+# Six pieces would be 7.6G positions with one table of 326M nodes, more than can be built here
+MAX_PIECES = 5
+# Larger than any distance while building
+UNSOLVED = 1 << 20
+
+
+# Material (PLAYER1 men, PLAYER1 kings, PLAYER2 men, PLAYER2 kings) in the order the tables are built and stored
+# A promotion leads to a table with the same number of pieces and fewer men so those are built first
+def signatures(maxpieces: int) -> list:
+    sigs = []
+    for total in range(2, maxpieces + 1):
+        for men in range(total + 1):
+            for m1 in range(men + 1):
+                m2 = men - m1
+                for k1 in range(total - men + 1):
+                    k2 = total - men - k1
+                    if m1 + k1 > 0 and m2 + k2 > 0:
+                        sigs.append((m1, k1, m2, k2))
+    return sigs
+
+
+# Number of ways to put the pieces on different squares, each group is placed on the squares left by the ones before
+def tableSize(sig: tuple) -> int:
+    size = 1
+    free = SQUARES
+    for k in sig[0], sig[2], sig[1], sig[3]:
+        size *= comb(free, k)
+        free -= k
+    return size
+
+
+def getSignature(game: Draughts) -> tuple:
+    return (game.men[PLAYER1].bit_count(), game.kings[PLAYER1].bit_count(),
+            game.men[PLAYER2].bit_count(), game.kings[PLAYER2].bit_count())
+
+
+# Perfect index of the piece placement, each group is ranked among the squares not used by the groups before it
+def positionIndex(game: Draughts, sig: tuple) -> int:
+    index = 0
+    occupied = 0
+    free = SQUARES
+    for mask, k in ((game.men[PLAYER1], sig[0]), (game.men[PLAYER2], sig[2]),
+                    (game.kings[PLAYER1], sig[1]), (game.kings[PLAYER2], sig[3])):
+        rank = 0
+        i = 0
+        m = mask
+        while m:
+            b = m & -m
+            m ^= b
+            i += 1
+            rank += comb(b.bit_length() - 1 - (occupied & (b - 1)).bit_count(), i)
+        index = index * comb(free, k) + rank
+        occupied |= mask
+        free -= k
+    return index
+
+
+# Every legal placement for the material, regular pieces can't be on the row they would be promoted on
+def placements(sig: tuple):
+    m1, k1, m2, k2 = sig
+    allsquares = range(SQUARES)
+    for men1 in itertools.combinations([s for s in allsquares if not PROMOTION_ROW[PLAYER1] >> s & 1], m1):
+        used1 = set(men1)
+        for men2 in itertools.combinations([s for s in allsquares if not PROMOTION_ROW[PLAYER2] >> s & 1
+                                            and s not in used1], m2):
+            used2 = used1.union(men2)
+            for kings1 in itertools.combinations([s for s in allsquares if s not in used2], k1):
+                used3 = used2.union(kings1)
+                for kings2 in itertools.combinations([s for s in allsquares if s not in used3], k2):
+                    yield (sum(1 << s for s in men1), sum(1 << s for s in kings1),
+                           sum(1 << s for s in men2), sum(1 << s for s in kings2))
+
+
+# Value for the player who just moved into a position worth v for the player to move
+def backValues(v: np.ndarray) -> np.ndarray:
+    return np.where(v < 0, 1 - v, np.where(v > 0, -v - 1, 0))
+
+
+def solveTable(sig: tuple, tables: dict) -> np.ndarray:
+    size = tableSize(sig)
+    game = Draughts()
+    # Node for the player to move: 0 for PLAYER1, 1 for PLAYER2 then the position index
+    extwin = np.full(2 * size, UNSOLVED, dtype=np.int64)
+    extloss = np.zeros(2 * size, dtype=np.int64)
+    extdraw = np.zeros(2 * size, dtype=bool)
+    valid = np.zeros(2 * size, dtype=bool)
+    # Moves inside the table, kept as packed 64 bit arrays rather than lists of Python ints
+    src = array("q")
+    dst = array("q")
+    for m1, k1, m2, k2 in placements(sig):
+        game.men = {PLAYER1: m1, PLAYER2: m2}
+        game.kings = {PLAYER1: k1, PLAYER2: k2}
+        index = positionIndex(game, sig)
+        for side, player in enumerate((PLAYER1, PLAYER2)):
+            node = side * size + index
+            valid[node] = True
+            game.turn = player
+            opponent = PLAYER1 + PLAYER2 - player
+            turns = game.legalTurns()
+            # A player with no legal moves forfeits their turn
+            if len(turns) == 0:
+                src.append(node)
+                dst.append((1 - side) * size + index)
+            for t in turns:
+                undo = game.makeMove(t)
+                if game.men[opponent] | game.kings[opponent] == 0:
+                    extwin[node] = 1
+                else:
+                    sig2 = getSignature(game)
+                    index2 = positionIndex(game, sig2)
+                    if sig2 == sig:
+                        src.append(node)
+                        dst.append((1 - side) * size + index2)
+                    else:
+                        v = int(backValues(np.array(tables[sig2][(1 - side) * tableSize(sig2) + index2])))
+                        if v > 0:
+                            extwin[node] = min(extwin[node], v)
+                        elif v < 0:
+                            extloss[node] = min(extloss[node], v)
+                        else:
+                            extdraw[node] = True
+                game.unmakeMove(undo)
+    src = np.frombuffer(src, dtype=np.int64)
+    dst = np.frombuffer(dst, dtype=np.int64)
+    values = np.zeros(2 * size, dtype=np.int64)
+    # Repeat until nothing changes, wins are found one ply further back each time
+    while True:
+        back = backValues(values[dst])
+        win = extwin.copy()
+        np.minimum.at(win, src, np.where(back > 0, back, UNSOLVED))
+        loss = extloss.copy()
+        np.minimum.at(loss, src, np.where(back < 0, back, 0))
+        draw = extdraw.copy()
+        np.logical_or.at(draw, src, back == 0)
+        newvalues = np.where(win < UNSOLVED, win, np.where(draw, 0, loss))
+        newvalues[~valid] = 0
+        if np.array_equal(newvalues, values):
+            break
+        values = newvalues
+    return np.clip(values, -127, 127).astype(np.int8)
+
+
+def buildTablebase(path: str = "tablebase.bin", maxpieces: int = 4, verbose: bool = True) -> None:
+    if maxpieces > MAX_PIECES:
+        raise ValueError(f"Tablebases can be built for up to {MAX_PIECES} pieces, not {maxpieces}")
+    tables = {}
+    with open(path, "wb") as f:
+        # The board size is stored so the tables aren't used for positions on another board
+        f.write(MAGIC + bytes([maxpieces, BOARD_SIZE, 0, 0]))
+        for sig in signatures(maxpieces):
+            t0 = time.time()
+            tables[sig] = solveTable(sig, tables)
+            f.write(tables[sig].tobytes())
+            if verbose:
+                t = tables[sig]
+                print(f"{sig}: {len(t)} positions, {(t > 0).sum()} wins, {(t < 0).sum()} losses "
+                      f"{round(time.time() - t0, 2)} seconds")
+
+
+class Tablebase:
+    def __init__(self, path: str = "tablebase.bin"):
+        with open(path, "rb") as f:
+            header = f.read(HEADER)
+        if header[:4] != MAGIC:
+            raise ValueError(f"{path} is not a draughts tablebase")
+        self.maxpieces = header[4]
+        # Files from before the size was stored are 8x8
+        self.size = header[5] or BOARD_SIZE
+        if self.size != BOARD_SIZE:
+            raise ValueError(f"{path} is for a {self.size}x{self.size} board, not {BOARD_SIZE}x{BOARD_SIZE}")
+        self.data = np.memmap(path, dtype=np.int8, mode="r", offset=HEADER)
+        self.offsets = {}
+        offset = 0
+        for sig in signatures(self.maxpieces):
+            self.offsets[sig] = offset
+            offset += 2 * tableSize(sig)
+        self.probes = 0
+        self.hits = 0
+
+    # Value for the player to move or None if the position isn't in the tablebase
+    def probe(self, game: Draughts):
+        if game.geometry.size != self.size:
+            return None
+        self.probes += 1
+        sig = getSignature(game)
+        if sig not in self.offsets:
+            return None
+        self.hits += 1
+        side = 0 if game.turn == PLAYER1 else 1
+        return int(self.data[self.offsets[sig] + side * tableSize(sig) + positionIndex(game, sig)])
+
+
+if __name__ == "__main__":
+    buildTablebase(maxpieces=int(sys.argv[1]) if len(sys.argv) > 1 else 4)
@@ -0,0 +1,191 @@
+# Tournaments between game playing agents
+# Matches are played in pairs of games from the same opening with the colours swapped, spread over a process pool
+# Elo is estimated as the games come in and a sequential probability ratio test (SPRT) can end a match early
+# once the result is decided
+import math
+import os
+import time
+from multiprocessing import Pool
+from draughts import Draughts
+from selfplay import playGame
+
+
+# Plays one draughts game, an opening is (encodeBoard string, player to move)
+# Returns PLAYER1 (1) if the first player wins, PLAYER2 (-1) if the second player wins and 0 for a draw
+def playDraughts(player1, player2, opening=None, seed: int = None, maxturns: int = 300) -> int:
+    game = Draughts()
+    if opening is not None:
+        encoding, player = opening
+        game.board = game.decodeBoard(encoding)
+        game.turn = player
+        game.resetHistory()
+    return playGame(player1, player2, seed, maxturns, game)["winner"]
+
+
+def eloFromScore(score: float) -> float:
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def scoreFromElo(elo: float) -> float:
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+# Mean and variance of the score per game
+# One extra win and one extra loss are counted so a sweep gives a finite Elo and a match of only draws a variance
+def scoreStats(wins: int, draws: int, losses: int) -> tuple:
+    n = wins + draws + losses
+    if n == 0:
+        return 0.5, 0.25
+    mean = (wins + 1 + 0.5 * draws) / (n + 2)
+    var = ((wins + 1) * (1 - mean) ** 2 + draws * (0.5 - mean) ** 2 + (losses + 1) * mean ** 2) / (n + 2)
+    return mean, var
+
+
+# Elo difference and its 95% margin
+def eloEstimate(wins: int, draws: int, losses: int) -> tuple:
+    n = wins + draws + losses
+    mean, var = scoreStats(wins, draws, losses)
+    if n == 0:
+        return 0.0, math.inf
+    se = math.sqrt(var / n)
+    upper = eloFromScore(mean + 1.96 * se)
+    lower = eloFromScore(mean - 1.96 * se)
+    return eloFromScore(mean), (upper - lower) / 2
+
+
+# Log likelihood ratio of elo1 against elo0 using the normal approximation to the score
+def sprtLLR(wins: int, draws: int, losses: int, elo0: float, elo1: float) -> float:
+    n = wins + draws + losses
+    mean, var = scoreStats(wins, draws, losses)
+    if n == 0:
+        return 0.0
+    s0 = scoreFromElo(elo0)
+    s1 = scoreFromElo(elo1)
+    return n * (s1 - s0) * (2 * mean - s0 - s1) / (2 * var)
+
+
+def sprtBounds(alpha: float, beta: float) -> tuple:
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def matchResult(wins: int, draws: int, losses: int, llr: float, decision) -> dict:
+    elo, margin = eloEstimate(wins, draws, losses)
+    return {"wins": wins, "draws": draws, "losses": losses, "games": wins + draws + losses, "elo": elo,
+            "margin": margin, "llr": llr, "decision": decision}
+
+
+# Plays the opening twice with the colours swapped, the results are from agent a's side (1 win, 0 draw, -1 loss)
+# games=1 only plays the first game, for the last pair of a match with an odd number of games
+def _playPair(args: tuple) -> tuple:
+    playfunc, a, b, opening, seed, games = args
+    first = playfunc(a, b, opening, seed)
+    if games == 1:
+        return (first,)
+    second = playfunc(b, a, opening, seed + 1)
+    return first, -second
+
+
+class Tournament:
+    # agents maps a name to the agent playfunc expects, playfunc(agent1, agent2, opening, seed) -> 1, 0 or -1
+    # processes=1 plays in this process, None uses one process per CPU
+    # progress(a, b, result) is called with the running result of a match after each batch of games
+    def __init__(self, agents: dict, playfunc=playDraughts, openings: list = None, processes: int = None,
+                 seed: int = 0, progress=None):
+        self.agents = agents
+        self.playfunc = playfunc
+        self.openings = openings
+        self.processes = processes
+        self.seed = seed
+        self.progress = progress
+
+    def _opening(self, pair: int):
+        if not self.openings:
+            return None
+        return self.openings[pair % len(self.openings)]
+
+    # sprt is (elo0, elo1, alpha, beta), the match stops when it accepts one of the hypotheses
+    def playMatch(self, a: str, b: str, maxgames: int = 200, sprt: tuple = None, pool=None,
+                  verbose: bool = True) -> dict:
+        wins = draws = losses = 0
+        decision = None
+        llr = 0.0
+        bounds = sprtBounds(sprt[2], sprt[3]) if sprt is not None else None
+        # SPRT is checked after each batch of game pairs so every process has work to do
+        batch = max(1, self.processes or os.cpu_count() or 1) if pool is not None else 1
+        pairs = (maxgames + 1) // 2
+        pair = 0
+        result = matchResult(0, 0, 0, llr, decision)
+        t0 = time.time()
+        while pair < pairs and decision is None:
+            tasks = [(self.playfunc, self.agents[a], self.agents[b], self._opening(p), self.seed + 2 * p,
+                      min(2, maxgames - 2 * p)) for p in range(pair, min(pairs, pair + batch))]
+            pair += len(tasks)
+            results = pool.imap_unordered(_playPair, tasks) if pool is not None else map(_playPair, tasks)
+            for games in results:
+                for r in games:
+                    if r == 1:
+                        wins += 1
+                    elif r == -1:
+                        losses += 1
+                    else:
+                        draws += 1
+            if sprt is not None:
+                llr = sprtLLR(wins, draws, losses, sprt[0], sprt[1])
+                if llr <= bounds[0]:
+                    decision = "H0"
+                elif llr >= bounds[1]:
+                    decision = "H1"
+            result = matchResult(wins, draws, losses, llr, decision)
+            if self.progress is not None:
+                self.progress(a, b, result)
+        if verbose:
+            elo, margin = result["elo"], result["margin"]
+            print(f"{a} vs {b}: +{wins} ={draws} -{losses} Elo {round(elo, 1)} +/- {round(margin, 1)} "
+                  f"LLR {round(llr, 2)} {decision or ''} ({round(time.time() - t0, 1)} seconds)")
+        return result
+
+    def _run(self, pairings: list, maxgames: int, sprt: tuple, verbose: bool) -> dict:
+        results = {}
+        if self.processes == 1:
+            for a, b in pairings:
+                results[(a, b)] = self.playMatch(a, b, maxgames, sprt, None, verbose)
+        else:
+            with Pool(self.processes) as pool:
+                for a, b in pairings:
+                    results[(a, b)] = self.playMatch(a, b, maxgames, sprt, pool, verbose)
+        return results
+
+    # Every agent plays every other agent
+    def roundRobin(self, maxgames: int = 200, sprt: tuple = None, verbose: bool = True) -> dict:
+        names = list(self.agents)
+        pairings = [(a, b) for i, a in enumerate(names) for b in names[i + 1:]]
+        return self._run(pairings, maxgames, sprt, verbose)
+
+    # One agent plays every other agent
+    def gauntlet(self, challenger: str, maxgames: int = 200, sprt: tuple = None, verbose: bool = True) -> dict:
+        pairings = [(challenger, b) for b in self.agents if b != challenger]
+        return self._run(pairings, maxgames, sprt, verbose)
+
+
+# Total score and average Elo difference for each agent
+def standings(results: dict) -> list:
+    table = {}
+    for (a, b), r in results.items():
+        for name, score, elo in ((a, r["wins"] + 0.5 * r["draws"], r["elo"]),
+                                 (b, r["losses"] + 0.5 * r["draws"], -r["elo"])):
+            entry = table.setdefault(name, {"score": 0, "games": 0, "elo": 0, "matches": 0})
+            entry["score"] += score
+            entry["games"] += r["games"]
+            entry["elo"] += elo
+            entry["matches"] += 1
+    rows = [(name, e["score"], e["games"], e["elo"] / e["matches"]) for name, e in table.items()]
+    return sorted(rows, key=lambda row: row[3], reverse=True)
+
+
+if __name__ == "__main__":
+    from selfplay import randomPlayer, greedyPlayer, SearchPlayer
+    tournament = Tournament({"random": randomPlayer, "greedy": greedyPlayer, "search3": SearchPlayer(maxdepth=3)})
+    res = tournament.roundRobin(maxgames=100, sprt=(0, 50, 0.05, 0.05))
+    for name, score, games, elo in standings(res):
+        print(f"{name}: {score}/{games} Elo {round(elo, 1)}")